@@ -1,19 +1,34 @@
 import streamlit as st
 from ocr_processor import OCRProcessor
 import tempfile
+import zipfile
 import os
 from PIL import Image
-import json
+import re
+import hashlib
+import orjson
 import subprocess
-from io import BytesIO
+import platform
+from io import BytesIO, StringIO
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import logging
+import concurrent.futures
+import copy
+from functools import lru_cache, partial
 from datetime import timedelta, datetime
 from docx import Document
 from docx.shared import Pt, RGBColor, Inches, Cm
 from docx.enum.text import WD_ALIGN_PARAGRAPH, WD_LINE_SPACING
+from docx.enum.style import WD_STYLE_TYPE
+from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from pathlib import Path
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+logger = logging.getLogger(__name__)
 
 # Page configuration
 st.set_page_config(
@@ -27,7 +42,8 @@ st.set_page_config(
 st.logo("https://skyone.solutions/wp-content/uploads/2024/12/logo-skyone-azul-scaled.webp")
 
 # Custom CSS - Anthropic Light Inspired Theme
-st.markdown("""
+# Streamlit drops elements a rerun does not emit, so this is written on every run
+APP_CSS = """
     <style>
     /* Logo size adjustment */
     [data-testid="stSidebarLogo"] img {
@@ -83,6 +99,12 @@ st.markdown("""
     }
     .sidebar .sidebar-content {
         background-color: #F7F7F7;
+        font-size: 8pt;
+    }
+    /* Results, statistics and download blocks */
+    [data-testid="stMain"] [data-testid="stExpander"] .stMarkdown,
+    [data-testid="stMain"] [data-testid="stVerticalBlockBorderWrapper"] .stMarkdown {
+        font-size: 11pt;
     }
     .warning-highlight {
         background-color: #FFF9C4;
@@ -104,7 +126,34 @@ st.markdown("""
         font-weight: 600;
     }
     </style>
-""", unsafe_allow_html=True)
+"""
+st.markdown(APP_CSS, unsafe_allow_html=True)
+
+# Highlighted warnings (styled by .warning-highlight in APP_CSS)
+WARN_NO_DOWNLOADS = """
+<div class="warning-highlight">
+    <p><strong>⚠️ Atenção:</strong> Nenhum resultado disponível para download.</p>
+    <p style="margin-top: 0.5rem; font-size: 0.9rem;">Processe os arquivos primeiro para gerar resultados disponíveis para download.</p>
+</div>
+"""
+WARN_NO_CONTENT = """
+<div class="warning-highlight">
+    <p><strong>⚠️ Atenção:</strong> Nenhum conteúdo foi extraído do arquivo processado.</p>
+    <p style="margin-top: 0.5rem; font-size: 0.9rem;">O processamento pode ter falhado ou o arquivo pode não conter texto legível. Verifique o arquivo e tente novamente.</p>
+</div>
+"""
+WARN_NO_VALID_CONTENT = """
+<div class="warning-highlight">
+    <p><strong>⚠️ Atenção:</strong> Nenhum conteúdo válido foi extraído dos arquivos processados.</p>
+    <p style="margin-top: 0.5rem; font-size: 0.9rem;">Todos os arquivos podem ter falhado no processamento ou não conterem texto legível. Verifique os erros acima e tente novamente.</p>
+</div>
+"""
+WARN_NO_RESULTS = """
+<div class="warning-highlight">
+    <p><strong>⚠️ Atenção:</strong> Nenhum resultado foi gerado durante o processamento.</p>
+    <p style="margin-top: 0.5rem; font-size: 0.9rem;">Verifique se os arquivos foram carregados corretamente e tente novamente.</p>
+</div>
+"""
 
 DEFAULT_MODELS = [
     "llava:7b",
@@ -114,7 +163,41 @@ DEFAULT_MODELS = [
     "minicpm-v",
 ]
 
-def get_available_models():
+# DOCX styling constants
+SEPARATOR_COLOR = RGBColor(200, 200, 200)
+FOOTER_COLOR = RGBColor(128, 128, 128)
+
+# Model list lookups: retries for transient errors and separate (connect, read) timeouts
+MODEL_FETCH_RETRIES = 3
+MODEL_FETCH_TIMEOUT = (3.05, 10)
+
+# Cheap shape checks so obviously malformed keys never reach the network
+_looks_like_openai_key = re.compile(r'^sk-[A-Za-z0-9_-]{20,}$').match
+_looks_like_gemini_key = re.compile(r'^AIza[0-9A-Za-z_-]{35}$').match
+
+@st.cache_resource
+def get_http_session():
+    """Shared HTTP session for model list lookups, reusing connections across reruns"""
+    session = requests.Session()
+    retry = Retry(
+        total=MODEL_FETCH_RETRIES,
+        backoff_factor=0.5,
+        backoff_max=5,  # Cap each wait so a flaky provider can't stall the sidebar for long
+        backoff_jitter=0.25,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=["GET"],
+        respect_retry_after_header=True,
+        raise_on_status=False  # Return the last response so non-200 statuses fall back to an empty list
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
+
+def _list_ollama_models_cli():
+    """List local models by parsing `ollama list` output"""
     try:
         result = subprocess.run(
             ["ollama", "list"],
@@ -132,101 +215,189 @@ def get_available_models():
     except Exception:
         return []
 
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_ollama_models():
+    """List local models from the running Ollama daemon, falling back to the CLI when it can't be reached.
+    Raises LookupError when nothing is found, so a failed lookup isn't cached"""
+    try:
+        # No retries: a stopped local daemon refuses at once, and failed lookups rerun on every sidebar refresh
+        response = requests.get(OLLAMA_TAGS_URL, timeout=(0.5, 2))
+        models = []
+        if response.status_code == 200:
+            models = [model["name"] for model in orjson.loads(response.content).get("models", [])]
+    except requests.exceptions.ConnectionError:
+        models = _list_ollama_models_cli()
+    except Exception:
+        models = []
+    if not models:
+        raise LookupError("no Ollama models found")
+    return models
+
+def get_available_models():
+    """Get local Ollama models; empty when the lookup failed"""
+    try:
+        return _fetch_ollama_models()
+    except LookupError:
+        return []
+
+@lru_cache(maxsize=8)
+def _openai_headers(api_key):
+    """Request headers for an OpenAI key, built once per key"""
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_openai_models(api_key):
+    """Fetch the GPT model list; errors propagate so failed lookups aren't cached"""
+    response = get_http_session().get("https://api.openai.com/v1/models", headers=_openai_headers(api_key), timeout=MODEL_FETCH_TIMEOUT)
+    response.raise_for_status()
+    models_data = orjson.loads(response.content)
+    # Get all available models (not just vision-specific); include all GPT models
+    all_models = {
+        model_id
+        for model in models_data.get("data", [])
+        if (model_id := model.get("id", "")).startswith("gpt-")
+    }
+    
+    # Sort and return unique models
+    return sorted(all_models, reverse=True)
+
 def get_openai_models(api_key):
     """Get available vision models from OpenAI API"""
-    if not api_key:
+    if not api_key or not _looks_like_openai_key(api_key):
         return []
     
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json"
-            }
-            response = requests.get("https://api.openai.com/v1/models", headers=headers, timeout=10)
-            if response.status_code == 200:
-                models_data = response.json()
-                # Get all available models (not just vision-specific)
-                all_models = []
-                for model in models_data.get("data", []):
-                    model_id = model.get("id", "")
-                    # Include all GPT models
-                    if model_id.startswith("gpt-"):
-                        all_models.append(model_id)
-                
-                # Sort and return unique models
-                all_models = sorted(set(all_models), reverse=True)
-                return all_models if all_models else []
-            elif response.status_code in [500, 502, 503, 504] and attempt < max_retries - 1:
-                # Retry on server errors
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                return []
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                st.warning(f"Erro ao buscar modelos da OpenAI após {max_retries} tentativas: {str(e)}")
-                return []
-        except Exception as e:
-            st.warning(f"Erro ao buscar modelos da OpenAI: {str(e)}")
-            return []
-    return []
+    try:
+        return _fetch_openai_models(api_key)
+    except requests.exceptions.HTTPError:
+        # Non-200 after the retries (e.g. a rejected key): no models, same as before the lookup was cached
+        return []
+    except requests.exceptions.RequestException as e:
+        st.warning(f"Erro ao buscar modelos da OpenAI após {MODEL_FETCH_RETRIES + 1} tentativas: {str(e)}")
+        return []
+    except Exception as e:
+        st.warning(f"Erro ao buscar modelos da OpenAI: {str(e)}")
+        return []
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _fetch_gemini_models(api_key):
+    """Fetch the Gemini vision model list; errors propagate so failed lookups aren't cached"""
+    url = f"https://generativelanguage.googleapis.com/v1beta/models?key={api_key}"
+    response = get_http_session().get(url, timeout=MODEL_FETCH_TIMEOUT)
+    response.raise_for_status()
+    models_data = orjson.loads(response.content)
+    # Extract model IDs from full names (e.g., "models/gemini-pro" -> "gemini-pro")
+    gemini_models = {
+        model_name.rsplit("/", 1)[-1]
+        for model in models_data.get("models", [])
+        if "/" in (model_name := model.get("name", ""))
+    }
+    
+    # Only include models that support vision
+    return sorted(
+        (model_id for model_id in gemini_models
+         if "vision" in model_id.lower() or "gemini-1.5" in model_id or "gemini-2" in model_id),
+        reverse=True
+    )
 
 def get_gemini_models(api_key):
     """Get available models from Google Gemini API"""
-    if not api_key:
+    if not api_key or not _looks_like_gemini_key(api_key):
         return []
     
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            url = f"https://generativelanguage.googleapis.com/v1beta/models?key={api_key}"
-            response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                models_data = response.json()
-                gemini_models = []
-                for model in models_data.get("models", []):
-                    model_name = model.get("name", "")
-                    # Extract model ID from full name (e.g., "models/gemini-pro" -> "gemini-pro")
-                    if "/" in model_name:
-                        model_id = model_name.split("/")[-1]
-                        # Only include models that support vision
-                        if "vision" in model_id.lower() or "gemini-1.5" in model_id or "gemini-2" in model_id:
-                            gemini_models.append(model_id)
-                
-                return sorted(set(gemini_models), reverse=True) if gemini_models else []
-            elif response.status_code in [500, 502, 503, 504] and attempt < max_retries - 1:
-                # Retry on server errors
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                return []
-        except requests.exceptions.RequestException as e:
-            if attempt < max_retries - 1:
-                time.sleep(2 ** attempt)
-                continue
-            else:
-                st.warning(f"Erro ao buscar modelos do Gemini após {max_retries} tentativas: {str(e)}")
-                return []
-        except Exception as e:
-            st.warning(f"Erro ao buscar modelos do Gemini: {str(e)}")
-            return []
-    return []
-
-def process_single_image(processor, image_path, format_type, enable_preprocessing, custom_prompt, language, status_text, timer_text):
+    try:
+        return _fetch_gemini_models(api_key)
+    except requests.exceptions.HTTPError:
+        # Non-200 after the retries (e.g. a rejected key): no models, same as before the lookup was cached
+        return []
+    except requests.exceptions.RequestException as e:
+        st.warning(f"Erro ao buscar modelos do Gemini após {MODEL_FETCH_RETRIES + 1} tentativas: {str(e)}")
+        return []
+    except Exception as e:
+        st.warning(f"Erro ao buscar modelos do Gemini: {str(e)}")
+        return []
+
+def get_secret_api_keys():
+    """Get the provider API keys configured in .streamlit/secrets.toml"""
+    try:
+        return {
+            "OpenAI": st.secrets.get("openai_api_key"),
+            "Google Gemini": st.secrets.get("gemini_api_key")
+        }
+    except FileNotFoundError:
+        return {}
+
+def prefetch_remote_models(openai_key, gemini_key):
+    """Fetch OpenAI and Gemini model lists in parallel, keyed by (provider, api_key)"""
+    # Worker threads need the script context so st.warning calls still render
+    ctx = get_script_run_ctx()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx, initargs=(None, ctx)) as executor:
+        openai_future = executor.submit(get_openai_models, openai_key)
+        gemini_future = executor.submit(get_gemini_models, gemini_key)
+        return {
+            ("OpenAI", openai_key): openai_future.result(),
+            ("Google Gemini", gemini_key): gemini_future.result()
+        }
+
+def get_processor(model_name, max_workers, api_provider, key_hash, api_key):
+    """Build the OCR processor once per session and configuration; the key hash stands in for the raw key.
+    Processors hold per-run state (progress callback, usage stats, raw results), so they are never shared across sessions"""
+    processors = st.session_state.setdefault('ocr_processors', {})
+    config = (model_name, max_workers, api_provider, key_hash)
+    if config not in processors:
+        processors[config] = OCRProcessor(
+            model_name=model_name,
+            max_workers=max_workers,
+            api_provider=api_provider,
+            api_key=api_key
+        )
+    return processors[config]
+
+# Minimum time between progress UI updates, in seconds
+PROGRESS_UPDATE_INTERVAL = 0.1
+
+# Prefix OCRProcessor puts on failed results
+ERROR_PREFIX = "Error processing image:"
+
+def _has_text(text, min_length=1):
+    """Return whether text holds at least min_length non-whitespace characters"""
+    # Both checks stop as soon as the answer is known instead of building a stripped copy
+    if not text:
+        return False
+    if min_length <= 1:
+        return not text.isspace()
+    remaining = min_length
+    for char in text:
+        if not char.isspace():
+            remaining -= 1
+            if not remaining:
+                return True
+    return False
+
+def _is_valid(text, min_length=1):
+    """Return whether a single-file OCR result holds usable text rather than an error"""
+    return _has_text(text, min_length) and not text.startswith(ERROR_PREFIX)
+
+def process_single_image(processor, image_path, format_type, enable_preprocessing, custom_prompt, language, status):
     """Process a single image and return the result"""
     try:
         start_time = time.time()
         
+        last_update = 0.0
+        
         # Create progress callback
         def update_progress(current, total, message):
-            elapsed = time.time() - start_time
-            timer_text.metric("⏱️ Tempo Decorrido", f"{elapsed:.1f}s")
-            status_text.text(message)
+            nonlocal last_update
+            now = time.time()
+            # Skip UI writes that arrive faster than the refresh interval (the final one always goes through)
+            if now - last_update < PROGRESS_UPDATE_INTERVAL and current < total:
+                return
+            last_update = now
+            elapsed = now - start_time
+            # Elapsed time and progress share one status label, so each tick is a single UI update
+            status.update(label=f"⏱️ {elapsed:.1f}s · {message}")
         
         # Set progress callback
         processor.progress_callback = update_progress
@@ -242,26 +413,30 @@ def process_single_image(processor, image_path, format_type, enable_preprocessin
         
         return result
     except Exception as e:
-        return f"Error processing image: {str(e)}"
+        return f"{ERROR_PREFIX} {str(e)}"
 
-def process_batch_images(processor, image_paths, format_type, enable_preprocessing, custom_prompt, language, status_text, timer_text):
+def process_batch_images(processor, image_paths, format_type, enable_preprocessing, custom_prompt, language, status):
     """Process multiple images and return results"""
     try:
         start_time = time.time()
         
+        last_update = 0.0
+        
         # Create progress callback
         def update_progress(current, total, message):
-            elapsed = time.time() - start_time
+            nonlocal last_update
+            now = time.time()
+            # Skip UI writes that arrive faster than the refresh interval (the final one always goes through)
+            if now - last_update < PROGRESS_UPDATE_INTERVAL and current < total:
+                return
+            last_update = now
+            elapsed = now - start_time
             avg_time = elapsed / current if current > 0 else 0
             estimated_total = avg_time * total
             remaining = estimated_total - elapsed
             
-            timer_text.metric(
-                "⏱️ Tempo Decorrido", 
-                f"{elapsed:.1f}s",
-                delta=f"~{remaining:.1f}s restantes" if remaining > 0 else None
-            )
-            status_text.text(message)
+            eta = f" (~{remaining:.1f}s restantes)" if remaining > 0 else ""
+            status.update(label=f"⏱️ {elapsed:.1f}s{eta} · {message}")
         
         # Set progress callback
         processor.progress_callback = update_progress
@@ -278,47 +453,64 @@ def process_batch_images(processor, image_paths, format_type, enable_preprocessi
     except Exception as e:
         return {"error": str(e)}
 
+def format_usage_metrics(usage_stats, elapsed_time, time_label="⏱️ Tempo"):
+    """Build the (label, value) pairs shown in the usage statistics block"""
+    return [
+        (time_label, f"{elapsed_time:.2f}s"),
+        ("📥 Tokens Entrada", f"{usage_stats.get('input_tokens', 0):,}"),
+        ("📤 Tokens Saída", f"{usage_stats.get('output_tokens', 0):,}"),
+    ]
+
+def render_metrics(metrics):
+    """Render (label, value) pairs side by side, one column per metric"""
+    for col, (label, value) in zip(st.columns(len(metrics)), metrics):
+        col.metric(label, value)
+
+def save_uploaded_file(uploaded_file, temp_dir):
+    """Write an uploaded file into temp_dir and return its path"""
+    temp_path = os.path.join(temp_dir, uploaded_file.name)
+    # getbuffer() is a zero-copy view of the whole upload, independent of the read position;
+    # release it right after writing so the upload buffer isn't pinned
+    with open(temp_path, "wb") as f, uploaded_file.getbuffer() as view:
+        f.write(view)
+    return temp_path
+
+# File types accepted for OCR (order is kept for user-facing messages)
+SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.pdf')
+_SUPPORTED_SUFFIXES = frozenset(SUPPORTED_EXTENSIONS)
+
+def _scan_supported_files(directory, recursive):
+    """Yield supported files in a directory with a single scandir pass per folder"""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        yield from _scan_supported_files(entry.path, recursive)
+                elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in _SUPPORTED_SUFFIXES:
+                    yield entry.path
+    except OSError:
+        # Unreadable folders are skipped, as glob does
+        return
+
 def get_files_from_folder(folder_path, recursive=False):
     """Get all supported image/PDF files from a folder"""
-    supported_extensions = ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.pdf']
-    image_paths = []
-    
-    folder_path = Path(folder_path)
-    
-    if not folder_path.exists():
-        return []
-    
-    if not folder_path.is_dir():
+    if not os.path.isdir(folder_path):
         return []
     
-    if recursive:
-        # Recursive search
-        for ext in supported_extensions:
-            image_paths.extend(folder_path.rglob(f'*{ext}'))
-            image_paths.extend(folder_path.rglob(f'*{ext.upper()}'))
-    else:
-        # Non-recursive search
-        for ext in supported_extensions:
-            image_paths.extend(folder_path.glob(f'*{ext}'))
-            image_paths.extend(folder_path.glob(f'*{ext.upper()}'))
-    
-    # Convert to strings and remove duplicates
-    return list(set([str(p) for p in image_paths]))
+    # Suffixes are compared case-insensitively, so each entry is checked once
+    return list(_scan_supported_files(folder_path, recursive))
 
 def validate_file_path(file_path):
     """Validate if a file path exists and is a supported format"""
-    supported_extensions = ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.pdf']
-    
-    file_path = Path(file_path)
-    
-    if not file_path.exists():
+    # isfile answers the common case with a single stat; exists is only checked to word the error
+    if not os.path.isfile(file_path):
+        if os.path.exists(file_path):
+            return False, "Caminho não é um arquivo"
         return False, "Arquivo não encontrado"
     
-    if not file_path.is_file():
-        return False, "Caminho não é um arquivo"
-    
-    if file_path.suffix.lower() not in supported_extensions:
-        return False, f"Formato não suportado. Formatos aceitos: {', '.join(supported_extensions)}"
+    if os.path.splitext(file_path)[1].lower() not in _SUPPORTED_SUFFIXES:
+        return False, f"Formato não suportado. Formatos aceitos: {', '.join(SUPPORTED_EXTENSIONS)}"
     
     return True, "OK"
 
@@ -336,8 +528,8 @@ def save_processed_file(original_file_path, result_text, save_dir, format_type_i
         # Always save as Word document (DOCX format)
         ext = ".docx"
         
-        # Convert result_text to dict format expected by create_structured_docx
-        # The function expects content_dict to be a dict with file names as keys and content as values
+        # Convert result_text to the content format expected by create_structured_docx
+        # (a dict of file name -> content for batch, the text itself for a single file)
         if is_batch:
             # For batch, result_text should already be a dict-like structure
             if isinstance(result_text, dict):
@@ -346,8 +538,8 @@ def save_processed_file(original_file_path, result_text, save_dir, format_type_i
                 # If it's a string, wrap it in a dict
                 content_dict = {Path(original_file_path).name: result_text}
         else:
-            # For single file, create a simple dict structure
-            content_dict = {Path(original_file_path).name: result_text}
+            # For single file, create_structured_docx takes the text itself
+            content_dict = result_text
         
         # Create Word document
         doc = create_structured_docx(
@@ -360,47 +552,88 @@ def save_processed_file(original_file_path, result_text, save_dir, format_type_i
             is_batch=is_batch
         )
         
-        # Save to buffer
-        doc_buffer = BytesIO()
-        doc.save(doc_buffer)
-        content = doc_buffer.getvalue()
-        
         # Create output file path
         output_filename = f"{original_name}_resultado{ext}"
         output_path = save_path / output_filename
         
-        # Save file as binary (Word document)
-        with open(output_path, 'wb') as f:
-            f.write(content)
+        # Save the Word document straight to disk, without an intermediate buffer
+        doc.save(output_path)
         
         return str(output_path), None
     except Exception as e:
         return None, str(e)
 
+# Host OS, resolved once at import
+_SYSTEM = platform.system()
+
 def open_folder_in_explorer(folder_path):
     """Open a folder in the system file explorer"""
-    import platform
     try:
-        if platform.system() == "Windows":
+        # isdir is False for missing paths, so one check covers both; fall back to the current directory
+        path_to_open = folder_path if folder_path and os.path.isdir(folder_path) else "."
+        if _SYSTEM == "Windows":
             # Windows: usar os.startfile ou explorer
-            if folder_path and os.path.exists(folder_path) and os.path.isdir(folder_path):
-                os.startfile(folder_path)
-            else:
-                # Abrir diretório atual se não houver pasta válida
-                os.startfile(".")
-        elif platform.system() == "Darwin":  # macOS
-            path_to_open = folder_path if folder_path and os.path.exists(folder_path) and os.path.isdir(folder_path) else "."
+            os.startfile(path_to_open)
+        elif _SYSTEM == "Darwin":  # macOS
             subprocess.Popen(["open", path_to_open])
         else:  # Linux
-            path_to_open = folder_path if folder_path and os.path.exists(folder_path) and os.path.isdir(folder_path) else "."
             subprocess.Popen(["xdg-open", path_to_open])
         return True, None
     except Exception as e:
         return False, str(e)
 
+CONTENT_STYLE = 'OCRBody'
+
+def _add_content_style(doc):
+    """Register the 11pt Calibri paragraph style used for extracted text"""
+    style = doc.styles.add_style(CONTENT_STYLE, WD_STYLE_TYPE.PARAGRAPH)
+    style.base_style = doc.styles['Normal']
+    style.font.name = 'Calibri'
+    style.font.size = Pt(11)
+
+def _add_separator(doc):
+    """Append an empty paragraph whose bottom border draws a light horizontal rule"""
+    paragraph = doc.element.body._add_p()
+    border = OxmlElement('w:bottom')
+    border.set(qn('w:val'), 'single')
+    border.set(qn('w:sz'), '4')
+    border.set(qn('w:space'), '1')
+    border.set(qn('w:color'), str(SEPARATOR_COLOR))
+    paragraph_borders = OxmlElement('w:pBdr')
+    paragraph_borders.append(border)
+    paragraph.get_or_add_pPr().append(paragraph_borders)
+
+# Characters XML 1.0 can't hold (C0 controls other than tab/LF/CR, surrogates, U+FFFE/U+FFFF);
+# OCR output occasionally carries form feeds or NULs, which python-docx rejects with a ValueError
+_XML_INVALID = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+def _xml_safe(text):
+    """Drop characters that can't be written to a .docx"""
+    return _XML_INVALID.sub('', text)
+
+def _add_content_paragraph(doc, text):
+    """Append a content paragraph referencing the content style, building its XML directly"""
+    # body._add_p keeps the paragraph ahead of the section properties
+    paragraph = doc.element.body._add_p()
+    paragraph.style = CONTENT_STYLE
+    run = paragraph.add_r()
+    # Newlines and tabs become <w:br/> and <w:tab/> as with run.text
+    run.text = _xml_safe(text)
+
+@lru_cache(maxsize=1)
+def _structured_docx_template():
+    """Parse the default template and register the content style once; callers work on deep copies"""
+    doc = Document()
+    _add_content_style(doc)
+    return doc
+
 def create_structured_docx(title, content_dict, model_name, format_type, language, elapsed_time=None, is_batch=False):
     """Create a structured DOCX document with professional formatting"""
-    doc = Document()
+    # Copying the parsed template is cheaper than unpacking the default .docx again
+    doc = copy.deepcopy(_structured_docx_template())
+    
+    # Single timestamp shared by metadata and footer
+    now = datetime.now()
     
     # Title
     title_para = doc.add_heading(title, 0)
@@ -409,36 +642,25 @@ def create_structured_docx(title, content_dict, model_name, format_type, languag
     # Add metadata section
     doc.add_heading('Informações do Processamento', level=1)
     
+    # Metadata rows (label, value)
+    metadata = [
+        ('Data e Hora', now.strftime('%d/%m/%Y %H:%M:%S')),
+        ('Modelo Utilizado', model_name),
+        ('Formato de Saída', format_type),
+        ('Idioma', language),
+    ]
+    if elapsed_time:
+        metadata.append(('Tempo de Processamento', f'{elapsed_time:.2f} segundos'))
+    
     # Create metadata table
-    metadata_table = doc.add_table(rows=5 if elapsed_time else 4, cols=2)
+    metadata_table = doc.add_table(rows=len(metadata), cols=2)
     metadata_table.style = 'Light Grid Accent 1'
     
-    # Fill metadata
-    row_idx = 0
-    cells = metadata_table.rows[row_idx].cells
-    cells[0].text = 'Data e Hora'
-    cells[1].text = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-    
-    row_idx += 1
-    cells = metadata_table.rows[row_idx].cells
-    cells[0].text = 'Modelo Utilizado'
-    cells[1].text = model_name
-    
-    row_idx += 1
-    cells = metadata_table.rows[row_idx].cells
-    cells[0].text = 'Formato de Saída'
-    cells[1].text = format_type
-    
-    row_idx += 1
-    cells = metadata_table.rows[row_idx].cells
-    cells[0].text = 'Idioma'
-    cells[1].text = language
-    
-    if elapsed_time:
-        row_idx += 1
-        cells = metadata_table.rows[row_idx].cells
-        cells[0].text = 'Tempo de Processamento'
-        cells[1].text = f'{elapsed_time:.2f} segundos'
+    # Fill metadata in a single pass over the rows
+    for row, (label, value) in zip(metadata_table.rows, metadata):
+        cells = row.cells
+        cells[0].text = label
+        cells[1].text = value
     
     # Add spacing
     doc.add_paragraph()
@@ -450,51 +672,74 @@ def create_structured_docx(title, content_dict, model_name, format_type, languag
         # For batch processing, iterate through multiple results
         for idx, (file_name, text) in enumerate(content_dict.items(), 1):
             # Add file header
-            doc.add_heading(f'{idx}. {file_name}', level=2)
+            doc.add_heading(_xml_safe(f'{idx}. {file_name}'), level=2)
             
             # Add separator line
-            p = doc.add_paragraph()
-            p.add_run('─' * 80)
-            run = p.runs[0]
-            run.font.color.rgb = RGBColor(200, 200, 200)
+            _add_separator(doc)
             
             # Add content with formatting
-            content_para = doc.add_paragraph()
-            run = content_para.add_run(text)
-            run.font.size = Pt(11)
-            run.font.name = 'Calibri'
+            _add_content_paragraph(doc, text)
             
             # Add spacing between files
             doc.add_paragraph()
     else:
         # For single file processing
         # Add separator line
-        p = doc.add_paragraph()
-        p.add_run('─' * 80)
-        run = p.runs[0]
-        run.font.color.rgb = RGBColor(200, 200, 200)
+        _add_separator(doc)
         
         # Add content with formatting
-        content_para = doc.add_paragraph()
-        run = content_para.add_run(content_dict)
-        run.font.size = Pt(11)
-        run.font.name = 'Calibri'
+        _add_content_paragraph(doc, content_dict)
     
     # Add footer
     doc.add_page_break()
     footer_section = doc.sections[0]
     footer = footer_section.footer
     footer_para = footer.paragraphs[0]
-    footer_para.text = f'Gerado por OCR Vision – Skyone LAB | {datetime.now().strftime("%d/%m/%Y %H:%M")}'
+    footer_para.text = f'Gerado por OCR Vision – Skyone LAB | {now.strftime("%d/%m/%Y %H:%M")}'
     footer_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
     run = footer_para.runs[0]
     run.font.size = Pt(9)
-    run.font.color.rgb = RGBColor(128, 128, 128)
+    run.font.color.rgb = FOOTER_COLOR
     
     return doc
 
-def create_minuta_doc(content_dict, is_batch=False):
-    """Create a document formatted according to Brazilian legal document standards (peças processuais)"""
+def _docx_bytes(doc):
+    """Serialize a python-docx Document to bytes"""
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def build_structured_docx_bytes(title, content_dict, model_name, format_type, language, elapsed_time=None, is_batch=False):
+    """Build the structured DOCX and return its serialized bytes, memoized across reruns"""
+    doc = create_structured_docx(
+        title=title,
+        content_dict=content_dict,
+        model_name=model_name,
+        format_type=format_type,
+        language=language,
+        elapsed_time=elapsed_time,
+        is_batch=is_batch
+    )
+    return _docx_bytes(doc)
+
+# Two consecutive line breaks (LF or CRLF) end a paragraph
+_PARAGRAPH_BREAK = re.compile(r'\r?\n\r?\n')
+
+# Whitespace around a line break, collapsed to one space when joining a paragraph's lines
+_LINE_BREAK = re.compile(r'\s*\n\s*')
+
+def _minuta_paragraphs(text):
+    """Split text into paragraphs on blank lines, joining each paragraph's lines with single spaces"""
+    # One split pass, without first copying the text to normalize CRLF line endings
+    for para_text in _PARAGRAPH_BREAK.split(text):
+        para_content = _LINE_BREAK.sub(' ', _xml_safe(para_text).strip())
+        if para_content:
+            yield para_content
+
+@lru_cache(maxsize=1)
+def _minuta_template():
+    """Build the page setup, styles and footer shared by every minuta once; callers work on deep copies"""
     doc = Document()
     
     # Configure page margins according to legal standards
@@ -506,69 +751,22 @@ def create_minuta_doc(content_dict, is_batch=False):
         section.bottom_margin = Cm(2)
         section.right_margin = Cm(2)
     
-    # Set default font and paragraph style
+    # Set default font
     style = doc.styles['Normal']
     font = style.font
     font.name = 'Times New Roman'
     font.size = Pt(12)
     
-    # Configure paragraph spacing (1.5 line spacing)
-    paragraph_format = style.paragraph_format
+    # 'Legal' paragraph style (1.5 line spacing, justified), shared by every content paragraph
+    legal = doc.styles.add_style('Legal', WD_STYLE_TYPE.PARAGRAPH)
+    legal.base_style = style
+    paragraph_format = legal.paragraph_format
     paragraph_format.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
     paragraph_format.line_spacing = 1.5
     paragraph_format.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
     paragraph_format.space_after = Pt(0)
     paragraph_format.space_before = Pt(0)
     
-    # Add content
-    if is_batch:
-        # For batch processing
-        for idx, (file_name, text) in enumerate(content_dict.items(), 1):
-            if idx > 1:
-                # Add page break between files
-                doc.add_page_break()
-            
-            # Split content into paragraphs (handle both \n\n and \n)
-            paragraphs = text.replace('\r\n', '\n').split('\n\n')
-            for para_text in paragraphs:
-                # Also split by single \n to handle line breaks within paragraphs
-                lines = para_text.split('\n')
-                para_content = ' '.join(line.strip() for line in lines if line.strip())
-                if para_content:
-                    p = doc.add_paragraph(para_content)
-                    p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                    # Apply paragraph formatting
-                    p_format = p.paragraph_format
-                    p_format.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
-                    p_format.line_spacing = 1.5
-                    p_format.space_after = Pt(0)
-                    p_format.space_before = Pt(0)
-                    # Apply formatting to all runs in paragraph
-                    for run in p.runs:
-                        run.font.name = 'Times New Roman'
-                        run.font.size = Pt(12)
-    else:
-        # For single file processing
-        # Split content into paragraphs (handle both \n\n and \n)
-        paragraphs = content_dict.replace('\r\n', '\n').split('\n\n')
-        for para_text in paragraphs:
-            # Also split by single \n to handle line breaks within paragraphs
-            lines = para_text.split('\n')
-            para_content = ' '.join(line.strip() for line in lines if line.strip())
-            if para_content:
-                p = doc.add_paragraph(para_content)
-                p.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                # Apply paragraph formatting
-                p_format = p.paragraph_format
-                p_format.line_spacing_rule = WD_LINE_SPACING.MULTIPLE
-                p_format.line_spacing = 1.5
-                p_format.space_after = Pt(0)
-                p_format.space_before = Pt(0)
-                # Apply formatting to all runs in paragraph
-                for run in p.runs:
-                    run.font.name = 'Times New Roman'
-                    run.font.size = Pt(12)
-    
     # Configure header and footer for page numbering
     section = doc.sections[0]
     
@@ -587,38 +785,376 @@ def create_minuta_doc(content_dict, is_batch=False):
     
     return doc
 
+def create_minuta_doc(content_dict, is_batch=False):
+    """Create a document formatted according to Brazilian legal document standards (peças processuais)"""
+    doc = copy.deepcopy(_minuta_template())
+    legal = doc.styles['Legal']
+    
+    # Add content
+    if is_batch:
+        # For batch processing
+        for idx, (file_name, text) in enumerate(content_dict.items(), 1):
+            if idx > 1:
+                # Add page break between files
+                doc.add_page_break()
+            
+            for para_content in _minuta_paragraphs(text):
+                doc.add_paragraph(para_content, legal)
+    else:
+        # For single file processing
+        for para_content in _minuta_paragraphs(content_dict):
+            doc.add_paragraph(para_content, legal)
+    
+    return doc
+
+@st.cache_data(show_spinner=False)
+def build_minuta_doc_bytes(content_dict, is_batch=False):
+    """Serialize the minuta document for the download buttons, memoized across reruns"""
+    return _docx_bytes(create_minuta_doc(content_dict=content_dict, is_batch=is_batch))
+
+@st.cache_data(show_spinner=False)
+def build_raw_all(named_texts):
+    """Concatenate (file_name, raw_text) pairs into the RAW download"""
+    # Write the pieces straight into one buffer instead of formatting a string per file
+    buffer = StringIO()
+    write = buffer.write
+    for file_name, raw_text in named_texts:
+        write("=== ")
+        write(file_name)
+        write(" ===\n")
+        write(raw_text)
+        write("\n\n")
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def dump_results_json(results):
+    """Serialize the batch results for the JSON download, memoized across reruns"""
+    return orjson.dumps(results, option=orjson.OPT_INDENT_2)
+
+@st.cache_data(show_spinner=False)
+def build_bundle_zip(results, raw_all, docx_bytes=None):
+    """Bundle the JSON, RAW and DOCX batch downloads into one zip archive"""
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as bundle:
+        bundle.writestr("ocr_results.json", dump_results_json(results))
+        bundle.writestr("ocr_results_raw.txt", raw_all)
+        # DOC is the same document as DOCX, so only one copy goes into the bundle
+        if docx_bytes is not None:
+            bundle.writestr("ocr_results.docx", docx_bytes)
+    return zip_buffer.getvalue()
+
+@st.cache_data(show_spinner=False)
+def parse_json_result(text):
+    """Parse a JSON OCR result once per unique text"""
+    return orjson.loads(text)
+
+def _render_json(text):
+    """Show a JSON result as a tree, falling back to a code block when it doesn't parse"""
+    try:
+        st.json(parse_json_result(text))
+    except (ValueError, TypeError):
+        st.code(text, language="json")
+
+# Result viewer per internal format; markdown, structured, key_value and table use the default
+_RENDERERS = {
+    "json": _render_json,
+    "text": st.text,
+    "doc97": st.text,
+}
+
+def render_result(text, format_type_internal):
+    """Render an OCR result in the view for its output format"""
+    _RENDERERS.get(format_type_internal, st.markdown)(text)
+
+@st.fragment
+def render_batch_results(valid_items, format_type_internal):
+    """Render one expander per (file_path, file_name, text) item, building its content only while it is open"""
+    for file_path, file_name, text in valid_items:
+        # on_change="rerun" tracks the open state, so collapsed files skip parsing and rendering
+        expander = st.expander(f"✅ {file_name}", key=f"result_{file_path}", on_change="rerun")
+        if not expander.open:
+            continue
+        with expander:
+            with st.container(border=True):
+                render_result(text, format_type_internal)
+
+@st.fragment
+def render_single_downloads(result, raw_result, build_docx):
+    """Render the single-file download options as a fragment so download clicks only rerun this block."""
+    st.subheader("📥 Opções de Download")
+    with st.container(border=True):
+        col1, col2, col3, col4, col5 = st.columns(5)
+        
+        with col1:
+            st.download_button(
+                "📥 Download TXT",
+                result,
+                file_name=f"ocr_result.txt",
+                mime="text/plain",
+                key="download_txt_single"
+            )
+        
+        with col2:
+            # Structured DOCX
+            st.download_button(
+                "📥 Download DOCX",
+                build_docx,
+                file_name="ocr_result.docx",
+                mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                key="download_docx_single"
+            )
+        
+        with col3:
+            # DOC format - same structured document
+            st.download_button(
+                "📥 Download DOC",
+                build_docx,
+                file_name="ocr_result.doc",
+                mime="application/msword",
+                key="download_doc_single"
+            )
+        
+        with col4:
+            # Raw result - exactly as LLM processed
+            st.download_button(
+                "📥 Download RAW",
+                raw_result,
+                file_name="ocr_result_raw.txt",
+                mime="text/plain",
+                help="Resultado exatamente como processado pela LLM, sem formatação",
+                key="download_raw_single"
+            )
+        
+        with col5:
+            # Formato Minuta - Legal document format, generated only when clicked
+            st.download_button(
+                "📄 Formato Minuta",
+                partial(build_minuta_doc_bytes, result),
+                file_name="minuta.doc",
+                mime="application/msword",
+                help="Documento formatado conforme padrão de peças processuais (fonte Times New Roman 12, espaçamento 1,5, margens padrão)",
+                key="download_minuta_single"
+            )
+
+@st.fragment
+def render_batch_downloads(results, batch_content, raw_all,
+                           selected_model, format_type, language, elapsed_time):
+    """Render the batch download options as a fragment so download clicks only rerun this block."""
+    st.subheader("📥 Opções de Download")
+    with st.container(border=True):
+        if results.get('results'):
+            # Build the structured document only when a button asks for it; the build is memoized,
+            # so DOCX, DOC and the ZIP bundle share the same bytes
+            build_docx = partial(
+                build_structured_docx_bytes,
+                title='Resultados do OCR (Lote)',
+                content_dict=batch_content,
+                model_name=selected_model,
+                format_type=format_type,
+                language=language,
+                elapsed_time=elapsed_time,
+                is_batch=True
+            )
+
+            def build_zip():
+                # A failed DOCX build leaves the document out of the archive (the button help says so)
+                try:
+                    docx_bytes = build_docx()
+                except Exception:
+                    logger.exception("Erro ao gerar DOCX para o ZIP")
+                    docx_bytes = None
+                return build_bundle_zip(results, raw_all, docx_bytes)
+
+            col1, col2, col3, col4, col5 = st.columns(5)
+
+            with col1:
+                # JSON format - serialized only when the button is clicked
+                st.download_button(
+                    "📥 Download JSON",
+                    partial(dump_results_json, results),
+                    file_name="ocr_results.json",
+                    mime="application/json",
+                    key="download_json_batch"
+                )
+
+            with col2:
+                # DOCX format - structured batch results
+                st.download_button(
+                    "📥 Download DOCX",
+                    build_docx,
+                    file_name="ocr_results.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+                    key="download_docx_batch"
+                )
+
+            with col3:
+                # DOC format - same structured batch document
+                st.download_button(
+                    "📥 Download DOC",
+                    build_docx,
+                    file_name="ocr_results.doc",
+                    mime="application/msword",
+                    key="download_doc_batch"
+                )
+
+            with col4:
+                # RAW format - exactly as LLM processed
+                st.download_button(
+                    "📥 Download RAW",
+                    raw_all,
+                    file_name="ocr_results_raw.txt",
+                    mime="text/plain",
+                    help="Resultados exatamente como processados pela LLM, sem formatação",
+                    key="download_raw_batch"
+                )
+
+            with col5:
+                # Formato Minuta - Legal document format for batch, generated only when clicked
+                st.download_button(
+                    "📄 Formato Minuta",
+                    partial(build_minuta_doc_bytes, batch_content, is_batch=True),
+                    file_name="minuta.doc",
+                    mime="application/msword",
+                    help="Documento formatado conforme padrão de peças processuais (fonte Times New Roman 12, espaçamento 1,5, margens padrão)",
+                    key="download_minuta_batch"
+                )
+
+            # Everything in one archive, generated only when clicked
+            st.download_button(
+                "📥 Download Tudo (ZIP)",
+                build_zip,
+                file_name="ocr_results.zip",
+                mime="application/zip",
+                help="JSON, RAW e DOCX do lote em um único arquivo compactado. Se o DOCX não puder ser gerado, o arquivo segue sem ele",
+                key="download_zip_batch"
+            )
+        else:
+            st.markdown(WARN_NO_DOWNLOADS, unsafe_allow_html=True)
+
+# Default prompt used when the prompt type is "Automático"
+AUTOMATIC_PROMPT = """Siga rigorosamente as instruções abaixo para processar o conteúdo do arquivo, garantindo que o resultado final esteja formatado de maneira totalmente compatível com Microsoft Word Document 97–2004 (.doc):
+
+1. Transcrição Integral e Fiel
+
+Transcreva o conteúdo completo, mantendo a estrutura, ordem e organização visual com a maior fidelidade possível ao documento original.
+
+2. Correção Automática de OCR
+
+Corrija apenas erros evidentes de leitura, como:
+• caracteres distorcidos;
+• letras ou sinais faltando;
+• palavras quebradas;
+• acentuação/ortografia claramente afetadas pelo OCR.
+
+3. Marcação de Ilegibilidade
+
+Se um trecho estiver ausente, ilegível ou incerto, marque TRECHO ILEGÍVEL exatamente onde ocorre.
+Nunca reordene o conteúdo para esconder falhas.
+
+4. Sem Inferências
+
+Não preencha lacunas com suposições.
+Use TRECHO ILEGÍVEL sempre que a leitura não for 100% segura.
+
+5. Reconstrução de Estruturas
+
+Caso o documento contenha tabelas, quadros, fichas, formulários, listas ou campos pré-definidos, reconstrua utilizando:
+• tabelas simples compatíveis com Word 97–2004;
+• listas numeradas ou com marcadores;
+• separação clara de seções;
+• títulos simples.
+
+🔗 Evitar: caixas de texto avançadas, ícones, figuras inline modernas, tabelas complexas ou recursos não suportados pelo formato .doc.
+
+6. Seção Final — Extração de Campos Estruturados
+
+Após a transcrição completa, apresente uma seção separada contendo:
+• campos identificados;
+• valores extraídos;
+• marcações TRECHO ILEGÍVEL quando necessário.
+
+Use uma tabela simples ou lista compatível com Word 97–2004 (.doc).
+
+7. Compatibilidade com Word 97–2004 (.doc)
+
+Todo o conteúdo deve utilizar apenas formatação legada:
+• tabelas simples;
+• listas simples;
+• negrito, itálico e sublinhado básicos;
+• seções com títulos;
+• nada de estilos avançados, emojis, cores especiais ou elementos modernos."""
+
+# Map translated format names to internal format values
+FORMAT_MAP = {
+    "Markdown": "markdown",
+    "Texto": "text",
+    "JSON": "json",
+    "Estruturado": "structured",
+    "Chave-Valor": "key_value",
+    "Tabela": "table",
+    "Documento do Word 97-2003": "doc97"
+}
+
+# Map preprocessing option to the processor's preprocess argument
+PREPROCESSING_MAP = {
+    "Ativado": True,
+    "Automático": "auto",
+    "Desativado": False
+}
+
+# Map provider name to internal format
+PROVIDER_MAP = {
+    "Ollama (Local)": "ollama",
+    "OpenAI": "openai",
+    "Google Gemini": "gemini"
+}
+
+# Content of the "Sobre o Skyone OCR" header expander
+ABOUT_HTML = """
+<div style='padding: 0.5rem 0;'>
+    <h2 style='
+        color: #1F1F1F;
+        font-size: 1.5rem;
+        font-weight: 600;
+        margin: 0 0 1rem 0;
+        padding: 0;
+    '>
+        🧾 Skyone OCR
+    </h2>
+    <p style='
+        color: #4A4A4A;
+        font-size: 0.95rem;
+        margin: 0;
+        padding: 0;
+        line-height: 1.6;
+    '>
+        Uma tecnologia de visão computacional e IA para extrair e interpretar textos de documentos, imagens e PDFs com máxima acurácia. 
+        <br><br>Projetado para impulsionar automações no Skyone Studio e alimentar agentes de IA com dados estruturados e confiáveis.
+    </p>
+</div>
+"""
+
 def main():
     # Header in expander
     with st.expander("ℹ️ Sobre o Skyone OCR", expanded=False):
-        st.markdown("""
-        <div style='padding: 0.5rem 0;'>
-            <h2 style='
-                color: #1F1F1F;
-                font-size: 1.5rem;
-                font-weight: 600;
-                margin: 0 0 1rem 0;
-                padding: 0;
-            '>
-                🧾 Skyone OCR
-            </h2>
-            <p style='
-                color: #4A4A4A;
-                font-size: 0.95rem;
-                margin: 0;
-                padding: 0;
-                line-height: 1.6;
-            '>
-                Uma tecnologia de visão computacional e IA para extrair e interpretar textos de documentos, imagens e PDFs com máxima acurácia. 
-                <br><br>Projetado para impulsionar automações no Skyone Studio e alimentar agentes de IA com dados estruturados e confiáveis.
-            </p>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(ABOUT_HTML, unsafe_allow_html=True)
 
     # Sidebar controls
     with st.sidebar:
-        st.markdown("<style>.sidebar .sidebar-content { font-size: 8pt; }</style>", unsafe_allow_html=True)
         st.header("Configurações IA")
         
+        # Pre-fetch both remote model lists in parallel when both keys are configured, so switching
+        # providers doesn't wait on a fresh request; refire only when the configured keys change.
+        # The keys only feed this prefetch: the lists are used when the user enters the same key
+        secret_keys = get_secret_api_keys()
+        openai_key, gemini_key = secret_keys.get("OpenAI"), secret_keys.get("Google Gemini")
+        prefetched_models = st.session_state.get('prefetched_models', {})
+        if openai_key and gemini_key and not (
+            ("OpenAI", openai_key) in prefetched_models and ("Google Gemini", gemini_key) in prefetched_models
+        ):
+            prefetched_models = prefetch_remote_models(openai_key, gemini_key)
+            st.session_state['prefetched_models'] = prefetched_models
+        
         # AI Configuration Section
         with st.expander("🤖 Inteligência Artificial", expanded=False):
             # API Provider Selection
@@ -637,6 +1173,14 @@ def main():
                     help=f"Insira sua chave de API do {api_provider}"
                 )
             
+            # Model lists are cached for a few minutes; let the user force a fresh lookup
+            if st.button("🔄 Atualizar modelos", key="refresh_models", help="Buscar novamente a lista de modelos disponíveis"):
+                _fetch_ollama_models.clear()
+                _fetch_openai_models.clear()
+                _fetch_gemini_models.clear()
+                st.session_state.pop('prefetched_models', None)
+                st.rerun()
+            
             # Model selection based on provider
             if api_provider == "Ollama (Local)":
                 available_models = get_available_models()
@@ -650,7 +1194,7 @@ def main():
                 )
             elif api_provider == "OpenAI":
                 # Get OpenAI models dynamically if API key is provided
-                openai_models = get_openai_models(api_key)
+                openai_models = prefetched_models.get(("OpenAI", api_key)) or get_openai_models(api_key)
                 if openai_models:
                     selected_model = st.selectbox(
                         "▪ Modelo de Visão",
@@ -658,12 +1202,15 @@ def main():
                         index=0,
                         help="Modelos disponíveis na sua conta OpenAI"
                     )
+                elif api_key and not _looks_like_openai_key(api_key):
+                    st.warning("⚠️ O formato da API Key da OpenAI parece inválido.")
+                    selected_model = None
                 else:
                     st.warning("⚠️ Insira a API Key da OpenAI para ver os modelos disponíveis.")
                     selected_model = None
             else:  # Google Gemini
                 # Get Gemini models dynamically if API key is provided
-                gemini_models = get_gemini_models(api_key)
+                gemini_models = prefetched_models.get(("Google Gemini", api_key)) or get_gemini_models(api_key)
                 if gemini_models:
                     selected_model = st.selectbox(
                         "▪ Modelo de Visão",
@@ -671,6 +1218,9 @@ def main():
                         index=0,
                         help="Modelos disponíveis na sua conta Google Gemini"
                     )
+                elif api_key and not _looks_like_gemini_key(api_key):
+                    st.warning("⚠️ O formato da API Key do Google Gemini parece inválido.")
+                    selected_model = None
                 else:
                     st.warning("⚠️ Insira a API Key do Google Gemini para ver os modelos disponíveis.")
                     selected_model = None
@@ -692,58 +1242,6 @@ def main():
                 help="Escolha entre prompt automático (padrão otimizado) ou manual (personalizado)"
             )
             
-            # Automatic prompt
-            automatic_prompt = """Siga rigorosamente as instruções abaixo para processar o conteúdo do arquivo, garantindo que o resultado final esteja formatado de maneira totalmente compatível com Microsoft Word Document 97–2004 (.doc):
-
-1. Transcrição Integral e Fiel
-
-Transcreva o conteúdo completo, mantendo a estrutura, ordem e organização visual com a maior fidelidade possível ao documento original.
-
-2. Correção Automática de OCR
-
-Corrija apenas erros evidentes de leitura, como:
-• caracteres distorcidos;
-• letras ou sinais faltando;
-• palavras quebradas;
-• acentuação/ortografia claramente afetadas pelo OCR.
-
-3. Marcação de Ilegibilidade
-
-Se um trecho estiver ausente, ilegível ou incerto, marque TRECHO ILEGÍVEL exatamente onde ocorre.
-Nunca reordene o conteúdo para esconder falhas.
-
-4. Sem Inferências
-
-Não preencha lacunas com suposições.
-Use TRECHO ILEGÍVEL sempre que a leitura não for 100% segura.
-
-5. Reconstrução de Estruturas
-
-Caso o documento contenha tabelas, quadros, fichas, formulários, listas ou campos pré-definidos, reconstrua utilizando:
-• tabelas simples compatíveis com Word 97–2004;
-• listas numeradas ou com marcadores;
-• separação clara de seções;
-• títulos simples.
-
-🔗 Evitar: caixas de texto avançadas, ícones, figuras inline modernas, tabelas complexas ou recursos não suportados pelo formato .doc.
-
-6. Seção Final — Extração de Campos Estruturados
-
-Após a transcrição completa, apresente uma seção separada contendo:
-• campos identificados;
-• valores extraídos;
-• marcações TRECHO ILEGÍVEL quando necessário.
-
-Use uma tabela simples ou lista compatível com Word 97–2004 (.doc).
-
-7. Compatibilidade com Word 97–2004 (.doc)
-
-Todo o conteúdo deve utilizar apenas formatação legada:
-• tabelas simples;
-• listas simples;
-• negrito, itálico e sublinhado básicos;
-• seções com títulos;
-• nada de estilos avançados, emojis, cores especiais ou elementos modernos."""
             
             # Custom prompt input (conditional)
             if prompt_type == "Manual":
@@ -755,26 +1253,25 @@ Todo o conteúdo deve utilizar apenas formatação legada:
                     height=200
                 )
             else:
-                custom_prompt_input = automatic_prompt
+                custom_prompt_input = AUTOMATIC_PROMPT
                 st.text_area(
                     "▪ Prompt Automático",
-                    value=automatic_prompt,
+                    value=AUTOMATIC_PROMPT,
                     help="Prompt automático otimizado para OCR com correção e marcação de ilegibilidade",
                     height=200,
                     disabled=True
                 )
         
-        st.markdown("<style>.sidebar .sidebar-content { font-size: 8pt; }</style>", unsafe_allow_html=True)
         st.header("Configurações Avançadas")
         # Advanced Settings
         with st.expander("⚙️ Configurações Avançadas", expanded=False):
             preprocessing_option = st.selectbox(
                 "▪ Pré-processamento",
-                options=["Ativado", "Desativado"],
+                options=["Ativado", "Automático", "Desativado"],
                 index=0,  # Default "Ativado"
-                help="Aplicar aprimoramento e pré-processamento de imagem"
+                help="Aplicar aprimoramento e pré-processamento de imagem. No modo automático, imagens PNG/JPEG pequenas são enviadas sem pré-processamento"
             )
-            enable_preprocessing = preprocessing_option == "Ativado"
+            enable_preprocessing = PREPROCESSING_MAP[preprocessing_option]
             
             language = st.text_input(
                 "▪ Idioma",
@@ -788,10 +1285,14 @@ Todo o conteúdo deve utilizar apenas formatação legada:
                 index=1,  # Default value 2
                 help="Número de imagens a processar em paralelo (para processamento em lote)"
             )
-            
+
+            # The processor is built further down, so the click is handled once it exists
+            clear_cache_clicked = st.button("🧹 Limpar cache", key="clear_ocr_cache",
+                                            help="Descarta os resultados de OCR memorizados e força um novo processamento")
+            clear_cache_notice = st.empty()
+
             st.divider()
         
-        st.markdown("<style>.sidebar .sidebar-content { font-size: 8pt; }</style>", unsafe_allow_html=True)
         st.header("Resultados")
         
         # Download Results Section
@@ -804,38 +1305,22 @@ Todo o conteúdo deve utilizar apenas formatação legada:
                 st.info("Processe arquivos para ver as opções de download")
     
     
-    # Map translated format names to internal format values
-    format_map = {
-        "Markdown": "markdown",
-        "Texto": "text",
-        "JSON": "json",
-        "Estruturado": "structured",
-        "Chave-Valor": "key_value",
-        "Tabela": "table",
-        "Documento do Word 97-2003": "doc97"
-    }
-    format_type_internal = format_map.get(format_type, "markdown")
+    format_type_internal = FORMAT_MAP.get(format_type, "markdown")
     
     # Set custom prompt based on type
     if prompt_type == "Automático":
-        custom_prompt = automatic_prompt
+        custom_prompt = AUTOMATIC_PROMPT
     else:
         custom_prompt = custom_prompt_input.strip() if custom_prompt_input.strip() != "" else None
 
-    # Map provider name to internal format
-    provider_map = {
-        "Ollama (Local)": "ollama",
-        "OpenAI": "openai",
-        "Google Gemini": "gemini"
-    }
-    
     # Initialize OCR Processor with API provider and key
     try:
-        processor = OCRProcessor(
-            model_name=selected_model, 
-            max_workers=max_workers,
-            api_provider=provider_map[api_provider],
-            api_key=api_key
+        processor = get_processor(
+            selected_model,
+            max_workers,
+            PROVIDER_MAP[api_provider],
+            hashlib.sha256(api_key.encode()).hexdigest() if api_key else None,
+            api_key
         )
     except ValueError as e:
         with st.expander("ℹ️ Aguardando Configuração", expanded=True):
@@ -862,6 +1347,10 @@ Todo o conteúdo deve utilizar apenas formatação legada:
             """, unsafe_allow_html=True)
         st.stop()
 
+    if clear_cache_clicked:
+        processor.clear_result_cache()
+        clear_cache_notice.success("Cache de OCR limpo.")
+
     # Upload container with tabs
     st.subheader("📤 Seleção de Arquivos")
     
@@ -886,9 +1375,11 @@ Todo o conteúdo deve utilizar apenas formatação legada:
             if uploaded_files:
                 st.divider()
                 st.write(f"**{len(uploaded_files)} arquivo(s) carregado(s):**")
-                for uploaded_file in uploaded_files:
-                    file_size = uploaded_file.size / (1024 * 1024)  # Convert to MB
-                    st.write(f"✓ {uploaded_file.name} ({file_size:.2f} MB)")
+                # One element for the whole list instead of one per file (size converted to MB)
+                st.markdown("  \n".join(
+                    f"✓ {uploaded_file.name} ({uploaded_file.size / (1024 * 1024):.2f} MB)"
+                    for uploaded_file in uploaded_files
+                ))
     
     with upload_tab2:
         # Seleção de pasta do sistema de arquivos
@@ -1066,14 +1557,9 @@ Todo o conteúdo deve utilizar apenas formatação legada:
             if source_type == "upload":
                 # Uploaded files - need to save to temp directory
                 with tempfile.TemporaryDirectory() as temp_dir:
-                    image_paths = []
-                    for uploaded_file in uploaded_files:
-                        # Reset file pointer before reading
-                        uploaded_file.seek(0)
-                        temp_path = os.path.join(temp_dir, uploaded_file.name)
-                        with open(temp_path, "wb") as f:
-                            f.write(uploaded_file.read())
-                        image_paths.append(temp_path)
+                    # Write the uploads concurrently; map keeps the upload order
+                    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                        image_paths = list(executor.map(partial(save_uploaded_file, temp_dir=temp_dir), uploaded_files))
                     
                     # Process files
                     _process_files(image_paths, processor, format_type_internal, enable_preprocessing, 
@@ -1095,20 +1581,16 @@ def _process_files(image_paths, processor, format_type_internal, enable_preproce
         st.info(f"📄 Processando 1 arquivo...")
     
     # Reset usage stats before processing
-    try:
-        processor.reset_usage_stats()
-    except Exception as e:
-        st.warning(f"Aviso ao resetar estatísticas: {e}")
+    processor.reset_usage_stats()
     
-    # Create timer and status components
-    timer_container = st.empty()
-    status_text = st.empty()
+    # Create the status component: one box for elapsed time and progress, cleared by its placeholder afterwards
+    status_placeholder = st.empty()
+    status = status_placeholder.status("Iniciando processamento...")
     
     start_time = time.time()
     
     if len(image_paths) == 1:
         # Single image processing
-        status_text.text("Iniciando processamento...")
         result = process_single_image(
             processor, 
             image_paths[0], 
@@ -1116,32 +1598,23 @@ def _process_files(image_paths, processor, format_type_internal, enable_preproce
             enable_preprocessing,
             custom_prompt,
             language,
-            status_text,
-            timer_container
+            status
         )
         
         # Show final time
         elapsed_time = time.time() - start_time
-        timer_container.empty()
-        status_text.empty()
+        status_placeholder.empty()
         
         # Get usage statistics
-        try:
-            usage_stats = processor.get_usage_stats()
-        except Exception as e:
-            st.warning(f"Aviso ao obter estatísticas: {e}")
-            usage_stats = {
-                'input_tokens': 0,
-                'output_tokens': 0,
-                'estimated_cost_brl': 0,
-                'estimated_cost_usd': 0
-            }
+        usage_stats = processor.get_usage_stats()
         
         st.success(f"✅ Processamento concluído em {elapsed_time:.2f}s!")
         
+        has_content = _is_valid(result, min_length=3)
+        
         # Save file automatically if save path is specified
         if save_output_path:
-            if result and result.strip() and not result.startswith("Error processing image:") and len(result.strip()) >= 3:
+            if has_content:
                 saved_path, error = save_processed_file(
                     image_paths[0], result, save_output_path, format_type_internal,
                     selected_model, format_type, language, elapsed_time, is_batch=False
@@ -1154,145 +1627,38 @@ def _process_files(image_paths, processor, format_type_internal, enable_preproce
         # Display usage statistics in a separate block
         with st.container(border=True):
             st.subheader("📊 Estatísticas de Uso")
-            st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-            col1, col2, col3 = st.columns(3)
-            with col1:
-                st.metric("⏱️ Tempo", f"{elapsed_time:.2f}s")
-            with col2:
-                st.metric("📥 Tokens Entrada", f"{usage_stats.get('input_tokens', 0):,}")
-            with col3:
-                st.metric("📤 Tokens Saída", f"{usage_stats.get('output_tokens', 0):,}")
-            st.markdown('</div>', unsafe_allow_html=True)
+            render_metrics(format_usage_metrics(usage_stats, elapsed_time))
         
-        # Get raw result
-        try:
-            if hasattr(processor, 'get_raw_result'):
-                raw_result = processor.get_raw_result() or result
-            else:
-                raw_result = result
-        except (AttributeError, Exception):
-            raw_result = result
+        # Get raw result (falls back to the formatted result when the LLM output wasn't kept)
+        raw_result = processor.get_raw_result() or result
         
         # Check if result is empty or contains only error messages
-        if not result or not result.strip() or result.startswith("Error processing image:") or len(result.strip()) < 3:
-            st.markdown("""
-            <div class="warning-highlight">
-                <p><strong>⚠️ Atenção:</strong> Nenhum conteúdo foi extraído do arquivo processado.</p>
-                <p style="margin-top: 0.5rem; font-size: 0.9rem;">O processamento pode ter falhado ou o arquivo pode não conter texto legível. Verifique o arquivo e tente novamente.</p>
-            </div>
-            """, unsafe_allow_html=True)
+        if not has_content:
+            st.markdown(WARN_NO_CONTENT, unsafe_allow_html=True)
         else:
+            # The structured document is built when a download is clicked; the build is memoized,
+            # so DOCX and DOC downloads share the same bytes
+            build_docx = partial(
+                build_structured_docx_bytes,
+                title='Resultado do OCR',
+                content_dict=result,
+                model_name=selected_model,
+                format_type=format_type,
+                language=language,
+                elapsed_time=elapsed_time,
+                is_batch=False
+            )
+            
             # Display results in the selected format in a separate block
             st.subheader(f"📝 Resultado Processado ({format_type})")
             with st.container(border=True):
-                st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-                if format_type_internal == "json":
-                    try:
-                        json_data = json.loads(result)
-                        st.json(json_data)
-                    except:
-                        st.code(result, language="json")
-                elif format_type_internal == "text":
-                    st.text(result)
-                elif format_type_internal == "doc97":
-                    st.text(result)
-                elif format_type_internal in ["structured", "key_value", "table"]:
-                    st.markdown(result)
-                else:  # markdown
-                    st.markdown(result)
-                st.markdown('</div>', unsafe_allow_html=True)
+                render_result(result, format_type_internal)
         
             # Download options for single result in a separate block
-            st.subheader("📥 Opções de Download")
-            with st.container(border=True):
-                st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-                col1, col2, col3, col4, col5 = st.columns(5)
-                
-                with col1:
-                    st.download_button(
-                        "📥 Download TXT",
-                        result,
-                        file_name=f"ocr_result.txt",
-                        mime="text/plain",
-                        key="download_txt_single"
-                    )
-                
-                with col2:
-                    # Create structured DOCX
-                    doc = create_structured_docx(
-                        title='Resultado do OCR',
-                        content_dict=result,
-                        model_name=selected_model,
-                        format_type=format_type,
-                        language=language,
-                        elapsed_time=elapsed_time,
-                        is_batch=False
-                    )
-                    docx_buffer = BytesIO()
-                    doc.save(docx_buffer)
-                    docx_buffer.seek(0)
-                    st.download_button(
-                        "📥 Download DOCX",
-                        docx_buffer.getvalue(),
-                        file_name="ocr_result.docx",
-                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                        key="download_docx_single"
-                    )
-                
-                with col3:
-                    # DOC format with structured content
-                    doc = create_structured_docx(
-                        title='Resultado do OCR',
-                        content_dict=result,
-                        model_name=selected_model,
-                        format_type=format_type,
-                        language=language,
-                        elapsed_time=elapsed_time,
-                        is_batch=False
-                    )
-                    doc_buffer = BytesIO()
-                    doc.save(doc_buffer)
-                    doc_buffer.seek(0)
-                    st.download_button(
-                        "📥 Download DOC",
-                        doc_buffer.getvalue(),
-                        file_name="ocr_result.doc",
-                        mime="application/msword",
-                        key="download_doc_single"
-                    )
-                
-                with col4:
-                    # Raw result - exactly as LLM processed
-                    st.download_button(
-                        "📥 Download RAW",
-                        raw_result,
-                        file_name="ocr_result_raw.txt",
-                        mime="text/plain",
-                        help="Resultado exatamente como processado pela LLM, sem formatação",
-                        key="download_raw_single"
-                    )
-                
-                with col5:
-                    # Formato Minuta - Legal document format
-                    minuta_doc = create_minuta_doc(
-                        content_dict=result,
-                        is_batch=False
-                    )
-                    minuta_buffer = BytesIO()
-                    minuta_doc.save(minuta_buffer)
-                    minuta_buffer.seek(0)
-                    st.download_button(
-                        "📄 Formato Minuta",
-                        minuta_buffer.getvalue(),
-                        file_name="minuta.doc",
-                        mime="application/msword",
-                        help="Documento formatado conforme padrão de peças processuais (fonte Times New Roman 12, espaçamento 1,5, margens padrão)",
-                        key="download_minuta_single"
-                    )
-                st.markdown('</div>', unsafe_allow_html=True)
+            render_single_downloads(result, raw_result, build_docx)
     else:
                     # Batch processing
-                    status_text.text("Iniciando processamento em lote...")
+                    status.update(label="Iniciando processamento em lote...")
                     try:
                         results = process_batch_images(
                             processor,
@@ -1301,43 +1667,42 @@ def _process_files(image_paths, processor, format_type_internal, enable_preproce
                             enable_preprocessing,
                             custom_prompt,
                             language,
-                            status_text,
-                            timer_container
+                            status
                         )
                     except Exception as e:
+                        # Full traceback goes to the server log; the page only shows the message
+                        logger.exception("Erro no processamento em lote")
                         st.error(f"❌ Erro no processamento em lote: {str(e)}")
-                        st.exception(e)
                         st.stop()
                     
                     # Show final time
                     elapsed_time = time.time() - start_time
-                    timer_container.empty()
-                    status_text.empty()
+                    status_placeholder.empty()
                     
                     # Get usage statistics
-                    try:
-                        usage_stats = processor.get_usage_stats()
-                    except Exception as e:
-                        st.warning(f"Aviso ao obter estatísticas: {e}")
-                        usage_stats = {
-                            'input_tokens': 0,
-                            'output_tokens': 0,
-                            'estimated_cost_brl': 0,
-                            'estimated_cost_usd': 0
-                        }
+                    usage_stats = processor.get_usage_stats()
                     
                     st.success(f"✅ Processamento em lote concluído em {elapsed_time:.2f}s!")
                     
+                    # Resolve file names and classify results in a single pass for the views and downloads below
+                    result_items = []
+                    valid_items = []
+                    for fp, text in results.get('results', {}).items():
+                        item = (fp, os.path.basename(fp), text)
+                        result_items.append(item)
+                        # Failures are already partitioned into results['errors'] by the processor,
+                        # so only emptiness is checked here
+                        if _has_text(text):
+                            valid_items.append(item)
+                    batch_content = {file_name: text for fp, file_name, text in result_items}
+                    
                     # Save files automatically if save path is specified
                     if save_output_path and results.get('results'):
                         saved_count = 0
                         save_errors = []
                         save_status = st.empty()
                         
-                        valid_results = {fp: text for fp, text in results['results'].items() 
-                                       if text and text.strip() and not text.startswith("Error processing image:")}
-                        
-                        for file_path, result_text in valid_results.items():
+                        for file_path, file_name, result_text in valid_items:
                             saved_path, error = save_processed_file(
                                 file_path, result_text, save_output_path, format_type_internal,
                                 selected_model, format_type, language, elapsed_time, is_batch=True
@@ -1345,7 +1710,7 @@ def _process_files(image_paths, processor, format_type_internal, enable_preproce
                             if saved_path:
                                 saved_count += 1
                             elif error:
-                                save_errors.append(f"{os.path.basename(file_path)}: {error}")
+                                save_errors.append(f"{file_name}: {error}")
                         
                         if saved_count > 0:
                             st.success(f"💾 {saved_count} arquivo(s) salvo(s) automaticamente em: {save_output_path}")
@@ -1357,234 +1722,64 @@ def _process_files(image_paths, processor, format_type_internal, enable_preproce
                                 st.caption(f"... e mais {len(save_errors) - 5} erro(s)")
                     
                     # Display processing and usage statistics side by side
+                    statistics = results.get('statistics', {})
                     col_stat1, col_stat2 = st.columns(2)
                     
                     with col_stat1:
                         with st.container(border=True):
                             st.subheader("📊 Estatísticas de Processamento")
-                            st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                st.metric("Total de Imagens", results.get('statistics', {}).get('total', 0))
-                            with col2:
-                                st.metric("Sucesso", results.get('statistics', {}).get('successful', 0))
-                            with col3:
-                                st.metric("Falhas", results.get('statistics', {}).get('failed', 0))
-                            st.markdown('</div>', unsafe_allow_html=True)
+                            render_metrics([
+                                ("Total de Imagens", statistics.get('total', 0)),
+                                ("Sucesso", statistics.get('successful', 0)),
+                                ("Falhas", statistics.get('failed', 0)),
+                            ])
                     
                     with col_stat2:
                         with st.container(border=True):
                             st.subheader("💡 Estatísticas de Uso")
-                            st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-                            col1, col2, col3 = st.columns(3)
-                            with col1:
-                                st.metric("⏱️ Tempo Total", f"{elapsed_time:.2f}s")
-                            with col2:
-                                st.metric("📥 Tokens Entrada", f"{usage_stats.get('input_tokens', 0):,}")
-                            with col3:
-                                st.metric("📤 Tokens Saída", f"{usage_stats.get('output_tokens', 0):,}")
-                            # Cost metrics (hidden/commented)
-                            # with col4:
-                            #     cost_brl = usage_stats.get('estimated_cost_brl', 0)
-                            #     if cost_brl > 0:
-                            #         st.metric("💰 Custo (BRL)", f"R$ {cost_brl:.4f}")
-                            #     else:
-                            #         st.metric("💰 Custo", "Gratuito")
-                            # with col5:
-                            #     cost_usd = usage_stats.get('estimated_cost_usd', 0)
-                            #     if cost_usd > 0:
-                            #         st.metric("💵 Custo (USD)", f"${cost_usd:.4f}")
-                            #     else:
-                            #         st.metric("💵 USD", "-")
-                            st.markdown('</div>', unsafe_allow_html=True)
+                            render_metrics(format_usage_metrics(usage_stats, elapsed_time, "⏱️ Tempo Total"))
+                            # Cost metrics (hidden/commented) - append to the list above to show them:
+                            # cost_brl = usage_stats.get('estimated_cost_brl', 0)
+                            # ("💰 Custo (BRL)", f"R$ {cost_brl:.4f}") if cost_brl > 0 else ("💰 Custo", "Gratuito")
+                            # cost_usd = usage_stats.get('estimated_cost_usd', 0)
+                            # ("💵 Custo (USD)", f"${cost_usd:.4f}") if cost_usd > 0 else ("💵 USD", "-")
 
                     # Display errors if any
                     if results.get('errors'):
-                        st.markdown("""
+                        # All failures go into a single element instead of one per file
+                        error_lines = "".join(
+                            f'<p style="margin-top: 0.5rem;"><strong>❌ {os.path.basename(file_path)}:</strong> {error}</p>'
+                            for file_path, error in results['errors'].items()
+                        )
+                        st.markdown(f"""
                         <div class="warning-highlight">
                             <p><strong>⚠️ Atenção:</strong> Alguns arquivos apresentaram erros durante o processamento:</p>
+                            {error_lines}
                         </div>
                         """, unsafe_allow_html=True)
-                        for file_path, error in results['errors'].items():
-                            st.markdown(f"""
-                            <div class="warning-highlight" style="margin-top: 0.5rem;">
-                                <p><strong>❌ {os.path.basename(file_path)}:</strong> {error}</p>
-                            </div>
-                            """, unsafe_allow_html=True)
 
                     # Display results in the selected format
                     if results.get('results'):
-                        # Filter out empty results
-                        valid_results = {fp: text for fp, text in results['results'].items() 
-                                       if text and text.strip() and not text.startswith("Error processing image:")}
-                        
-                        if valid_results:
+                        if valid_items:
                             st.subheader(f"📝 Resultados Processados ({format_type})")
-                            for file_path, text in valid_results.items():
-                                with st.expander(f"✅ {os.path.basename(file_path)}", expanded=True):
-                                    with st.container(border=True):
-                                        st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-                                        if format_type_internal == "json":
-                                            try:
-                                                json_data = json.loads(text)
-                                                st.json(json_data)
-                                            except:
-                                                st.code(text, language="json")
-                                        elif format_type_internal == "text":
-                                            st.text(text)
-                                        elif format_type_internal == "doc97":
-                                            st.text(text)
-                                        elif format_type_internal in ["structured", "key_value", "table"]:
-                                            st.markdown(text)
-                                        else:  # markdown
-                                            st.markdown(text)
-                                        st.markdown('</div>', unsafe_allow_html=True)
+                            render_batch_results(valid_items, format_type_internal)
                         else:
                             # All results are empty or errors
-                            st.markdown("""
-                            <div class="warning-highlight">
-                                <p><strong>⚠️ Atenção:</strong> Nenhum conteúdo válido foi extraído dos arquivos processados.</p>
-                                <p style="margin-top: 0.5rem; font-size: 0.9rem;">Todos os arquivos podem ter falhado no processamento ou não conterem texto legível. Verifique os erros acima e tente novamente.</p>
-                            </div>
-                            """, unsafe_allow_html=True)
+                            st.markdown(WARN_NO_VALID_CONTENT, unsafe_allow_html=True)
                     else:
-                        st.markdown("""
-                        <div class="warning-highlight">
-                            <p><strong>⚠️ Atenção:</strong> Nenhum resultado foi gerado durante o processamento.</p>
-                            <p style="margin-top: 0.5rem; font-size: 0.9rem;">Verifique se os arquivos foram carregados corretamente e tente novamente.</p>
-                        </div>
-                        """, unsafe_allow_html=True)
+                        st.markdown(WARN_NO_RESULTS, unsafe_allow_html=True)
 
                     # Get raw results
-                    try:
-                        if hasattr(processor, 'get_raw_results'):
-                            raw_results_dict = processor.get_raw_results()
-                        else:
-                            raw_results_dict = {}
-                    except (AttributeError, Exception):
-                        raw_results_dict = {}
+                    raw_results_dict = processor.get_raw_results()
+                    
+                    # Combine all raw results once (fallback to formatted if raw not available)
+                    raw_all = build_raw_all(tuple(
+                        (file_name, raw_results_dict.get(fp, text)) for fp, file_name, text in result_items
+                    ))
                     
                     # Download all results in different formats in a separate block
-                    st.subheader("📥 Opções de Download")
-                    with st.container(border=True):
-                        st.markdown('<div style="font-size: 11pt;">', unsafe_allow_html=True)
-                        if results.get('results'):
-                            col1, col2, col3, col4, col5 = st.columns(5)
-                            
-                            with col1:
-                                # JSON format
-                                json_results = json.dumps(results, indent=2, ensure_ascii=False)
-                                st.download_button(
-                                    "📥 Download JSON",
-                                    json_results,
-                                    file_name="ocr_results.json",
-                                    mime="application/json",
-                                    key="download_json_batch"
-                                )
-                            
-                            with col2:
-                                # DOCX format - structured batch results
-                                try:
-                                    batch_content = {os.path.basename(fp): text for fp, text in results['results'].items()}
-                                    doc = create_structured_docx(
-                                        title='Resultados do OCR (Lote)',
-                                        content_dict=batch_content,
-                                        model_name=selected_model,
-                                        format_type=format_type,
-                                        language=language,
-                                        elapsed_time=elapsed_time,
-                                        is_batch=True
-                                    )
-                                    docx_buffer = BytesIO()
-                                    doc.save(docx_buffer)
-                                    docx_buffer.seek(0)
-                                    st.download_button(
-                                        "📥 Download DOCX",
-                                        docx_buffer.getvalue(),
-                                        file_name="ocr_results.docx",
-                                        mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-                                        key="download_docx_batch"
-                                    )
-                                except Exception as e:
-                                    st.error(f"Erro ao gerar DOCX: {e}")
-                            
-                            with col3:
-                                # DOC format - structured batch results
-                                try:
-                                    batch_content = {os.path.basename(fp): text for fp, text in results['results'].items()}
-                                    doc = create_structured_docx(
-                                        title='Resultados do OCR (Lote)',
-                                        content_dict=batch_content,
-                                        model_name=selected_model,
-                                        format_type=format_type,
-                                        language=language,
-                                        elapsed_time=elapsed_time,
-                                        is_batch=True
-                                    )
-                                    doc_buffer = BytesIO()
-                                    doc.save(doc_buffer)
-                                    doc_buffer.seek(0)
-                                    st.download_button(
-                                        "📥 Download DOC",
-                                        doc_buffer.getvalue(),
-                                        file_name="ocr_results.doc",
-                                        mime="application/msword",
-                                        key="download_doc_batch"
-                                    )
-                                except Exception as e:
-                                    st.error(f"Erro ao gerar DOC: {e}")
-                            
-                            with col4:
-                                # RAW format - exactly as LLM processed
-                                try:
-                                    # Combine all raw results
-                                    raw_content = []
-                                    for fp, text in results['results'].items():
-                                        file_name = os.path.basename(fp)
-                                        raw_text = raw_results_dict.get(fp, text)  # Fallback to formatted if raw not available
-                                        raw_content.append(f"=== {file_name} ===\n{raw_text}\n\n")
-                                    
-                                    raw_all = "\n".join(raw_content)
-                                    st.download_button(
-                                        "📥 Download RAW",
-                                        raw_all,
-                                        file_name="ocr_results_raw.txt",
-                                        mime="text/plain",
-                                        help="Resultados exatamente como processados pela LLM, sem formatação",
-                                        key="download_raw_batch"
-                                    )
-                                except Exception as e:
-                                    st.error(f"Erro ao gerar RAW: {e}")
-                            
-                            with col5:
-                                # Formato Minuta - Legal document format for batch
-                                try:
-                                    batch_content = {os.path.basename(fp): text for fp, text in results['results'].items()}
-                                    minuta_doc = create_minuta_doc(
-                                        content_dict=batch_content,
-                                        is_batch=True
-                                    )
-                                    minuta_buffer = BytesIO()
-                                    minuta_doc.save(minuta_buffer)
-                                    minuta_buffer.seek(0)
-                                    st.download_button(
-                                        "📄 Formato Minuta",
-                                        minuta_buffer.getvalue(),
-                                        file_name="minuta.doc",
-                                        mime="application/msword",
-                                        help="Documento formatado conforme padrão de peças processuais (fonte Times New Roman 12, espaçamento 1,5, margens padrão)",
-                                        key="download_minuta_batch"
-                                    )
-                                except Exception as e:
-                                    st.error(f"Erro ao gerar Minuta: {e}")
-                        else:
-                            st.markdown("""
-                            <div class="warning-highlight">
-                                <p><strong>⚠️ Atenção:</strong> Nenhum resultado disponível para download.</p>
-                                <p style="margin-top: 0.5rem; font-size: 0.9rem;">Processe os arquivos primeiro para gerar resultados disponíveis para download.</p>
-                            </div>
-                            """, unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
+                    render_batch_downloads(results, batch_content, raw_all,
+                                           selected_model, format_type, language, elapsed_time)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
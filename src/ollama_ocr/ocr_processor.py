@@ -1,5 +1,6 @@
 import json
-from typing import Dict, Any, List, Union, Optional
+import hashlib
+from typing import Dict, Any, List, Union, Optional, Tuple
 import os
 import base64
 import requests
@@ -7,6 +8,7 @@ from tqdm import tqdm
 import concurrent.futures
 from pathlib import Path
 import cv2
+from PIL import Image
 import pymupdf 
 import numpy as np
 from threading import Lock
@@ -38,6 +40,61 @@ class OCRProcessor:
     # Taxa de câmbio USD para BRL (atualizar conforme necessário)
     USD_TO_BRL = 6.10
     
+    # OCR prompt per output format; {language} is filled in by _build_prompt
+    PROMPT_TEMPLATES = {
+        "markdown": """Extract all text content from this image in {language} **exactly as it appears**, without modification, summarization, or omission.
+                                Format the output in markdown:
+                                - Use headers (#, ##, ###) **only if they appear in the image**
+                                - Preserve original lists (-, *, numbered lists) as they are
+                                - Maintain all text formatting (bold, italics, underlines) exactly as seen
+                                - **Do not add, interpret, or restructure any content**
+                            """,
+        "text": """Extract all visible text from this image in {language} **without any changes**.
+                                - **Do not summarize, paraphrase, or infer missing text.**
+                                - Retain all spacing, punctuation, and formatting exactly as in the image.
+                                - If text is unclear or partially visible, extract as much as possible without guessing.
+                                - **Include all text, even if it seems irrelevant or repeated.** 
+                                """,
+        "json": """Extract all text from this image in {language} and format it as JSON, **strictly preserving** the structure.
+                                - **Do not summarize, add, or modify any text.**
+                                - Maintain hierarchical sections and subsections as they appear.
+                                - Use keys that reflect the document's actual structure (e.g., "title", "body", "footer").
+                                - Include all text, even if fragmented, blurry, or unclear.
+                                """,
+        "structured": """Extract all text from this image in {language}, **ensuring complete structural accuracy**:
+                                - Identify and format tables **without altering content**.
+                                - Preserve list structures (bulleted, numbered) **exactly as shown**.
+                                - Maintain all section headings, indents, and alignments.
+                                - **Do not add, infer, or restructure the content in any way.**
+                                """,
+        "key_value": """Extract all key-value pairs from this image in {language} **exactly as they appear**:
+                                - Identify and extract labels and their corresponding values without modification.
+                                - Maintain the exact wording, punctuation, and order.
+                                - Format each pair as 'key: value' **only if clearly structured that way in the image**.
+                                - **Do not infer missing values or add any extra text.**
+                                """,
+        "table": """Extract all tabular data from this image in {language} **exactly as it appears**, without modification, summarization, or omission.
+                                - **Preserve the table structure** (rows, columns, headers) as closely as possible.
+                                - **Do not add missing values or infer content**—if a cell is empty, leave it empty.
+                                - Maintain all numerical, textual, and special character formatting.
+                                - If the table contains merged cells, indicate them clearly without altering their meaning.
+                                - Output the table in a structured format such as Markdown, CSV, or JSON, based on the intended use.
+                                """,
+        "doc97": """Extract all visible text from this image in {language} **without any changes**.
+                                - **Do not summarize, paraphrase, or infer missing text.**
+                                - Retain all spacing, punctuation, and formatting exactly as in the image.
+                                - If text is unclear or partially visible, extract as much as possible without guessing.
+                                - **Include all text, even if it seems irrelevant or repeated.**
+                                - Format the output as plain text suitable for a Word 97-2003 document.
+                                """,
+    }
+    
+    # Número máximo de resultados de OCR mantidos em memória
+    RESULT_CACHE_SIZE = 200
+    
+    # Com preprocess="auto", imagens PNG/JPEG com o menor lado até este tamanho não são pré-processadas
+    SMALL_IMAGE_MAX_SIDE = 1024
+    
     def __init__(self, model_name: str = "llama3.2-vision:11b", 
                  base_url: str = "http://localhost:11434/api/generate",
                  max_workers: int = 1,
@@ -62,11 +119,16 @@ class OCRProcessor:
         self.last_raw_result = None
         self.raw_results = {}  # For batch processing
         
+        # OCR results keyed on file digest and processing options
+        self.result_cache = {}
+        self.cache_lock = Lock()
+        
         # Initialize tokenizer for OpenAI models
         if self.api_provider == "openai":
             try:
                 self.tokenizer = tiktoken.encoding_for_model(self.model_name)
-            except:
+            except KeyError:
+                # Unknown model names fall back to the GPT-4 family encoding
                 self.tokenizer = tiktoken.get_encoding("cl100k_base")
         else:
             self.tokenizer = None
@@ -103,7 +165,8 @@ class OCRProcessor:
             allowed_methods=["POST", "GET"],  # Allow retries for POST and GET
             raise_on_status=False  # Don't raise immediately, let us handle it
         )
-        adapter = HTTPAdapter(max_retries=retry)
+        # Keep one pooled connection per batch worker so concurrent requests reuse keep-alive connections
+        adapter = HTTPAdapter(pool_maxsize=max(1, self.max_workers), max_retries=retry)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
@@ -138,7 +201,7 @@ class OCRProcessor:
             else:
                 # Ollama local - estimate based on image size
                 return (width * height) // 1000
-        except:
+        except Exception:
             return 500  # Default estimate
     
     def _calculate_cost(self, input_tokens: int, output_tokens: int) -> float:
@@ -404,6 +467,9 @@ class OCRProcessor:
         - Language-specific preprocessing (if applicable)
         - Enhance contrast
         - Reduce noise
+        
+        Returns the preprocessed image as a base64-encoded JPEG, kept in memory
+        instead of being written next to the input and read back.
         """
         # Read image
         image = cv2.imread(image_path)
@@ -432,11 +498,12 @@ class OCRProcessor:
             thresh = cv2.threshold(denoised, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
             thresh = cv2.bitwise_not(thresh)
 
-        # Save preprocessed image
-        preprocessed_path = f"{image_path}_preprocessed.jpg"
-        cv2.imwrite(preprocessed_path, thresh)
+        # Encode preprocessed image
+        ok, encoded = cv2.imencode(".jpg", thresh)
+        if not ok:
+            raise ValueError(f"Could not encode preprocessed image for {image_path}")
 
-        return preprocessed_path
+        return base64.b64encode(encoded.tobytes()).decode("utf-8")
 
     def process_image(self, image_path: str, format_type: str = "markdown", preprocess: bool = True, 
                       custom_prompt: str = None, language: str = "en") -> str:
@@ -446,107 +513,124 @@ class OCRProcessor:
         Args:
             image_path: Path to the image file or PDF file
             format_type: One of ["markdown", "text", "json", "structured", "key_value","custom"]
-            preprocess: Whether to apply image preprocessing
+            preprocess: Whether to apply image preprocessing; "auto" skips it for small PNG/JPEG images
             custom_prompt: If provided, this prompt overrides the default based on format_type
             language: Language code to apply language specific OCR preprocessing
         """
+        result, self.last_raw_result = self._process_image(
+            image_path, format_type, preprocess, custom_prompt, language
+        )
+        return result
+
+    def _build_prompt(self, format_type: str, custom_prompt: Optional[str], language: str) -> str:
+        """Return the custom prompt when one is set, otherwise the template for the format"""
+        if custom_prompt and custom_prompt.strip():
+            return custom_prompt
+        template = self.PROMPT_TEMPLATES.get(format_type, self.PROMPT_TEMPLATES["text"])
+        return template.format(language=language)
+
+    @staticmethod
+    def _file_digest(path: str) -> str:
+        """Hash the file contents so identical uploads share a cache entry."""
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _resolve_preprocess(self, image_path: str, preprocess: Union[bool, str]) -> bool:
+        """Turn preprocess="auto" into a decision for this file; explicit True/False is kept"""
+        if preprocess != "auto":
+            return bool(preprocess)
+        try:
+            # Image.open only reads the header, so this doesn't decode the pixels
+            with Image.open(image_path) as image:
+                return not (image.format in ("PNG", "JPEG") and min(image.size) <= self.SMALL_IMAGE_MAX_SIDE)
+        except Exception:
+            # PDFs and formats Pillow can't identify are preprocessed
+            return True
+
+    def clear_result_cache(self):
+        """Discard all memoized OCR results."""
+        with self.cache_lock:
+            self.result_cache.clear()
+
+    def _process_image(self, image_path: str, format_type: str, preprocess: bool,
+                       custom_prompt: Optional[str], language: str,
+                       report_progress: bool = True) -> Tuple[str, Optional[str]]:
+        """
+        Process an image (or PDF), reusing the result of an earlier run on the
+        same file contents with the same options. Errors are never cached.
+        
+        Returns:
+            Tuple of (formatted result, raw LLM result)
+        """
+        # Resolve "auto" first so single and batch runs of the same file share a cache entry
+        preprocess = self._resolve_preprocess(image_path, preprocess)
+        try:
+            cache_key = (self._file_digest(image_path), format_type, preprocess,
+                         custom_prompt, language)
+        except OSError:
+            cache_key = None
+        
+        cached = self.result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return cached
+        
+        result, raw_result = self._run_ocr(image_path, format_type, preprocess,
+                                           custom_prompt, language, report_progress)
+        
+        if cache_key and not result.startswith("Error processing image:"):
+            with self.cache_lock:
+                if len(self.result_cache) >= self.RESULT_CACHE_SIZE:
+                    # Drop the oldest entry (dicts keep insertion order)
+                    self.result_cache.pop(next(iter(self.result_cache)))
+                self.result_cache[cache_key] = (result, raw_result)
+        return result, raw_result
+
+    def _run_ocr(self, image_path: str, format_type: str, preprocess: bool,
+                 custom_prompt: Optional[str], language: str,
+                 report_progress: bool = True) -> Tuple[str, Optional[str]]:
+        """
+        Process an image (or PDF) without touching shared instance state,
+        so it can run concurrently from process_batch.
+        
+        Returns:
+            Tuple of (formatted result, raw LLM result)
+        """
+        raw_result = None
         try:
-            # Reset raw result for this processing
-            self.last_raw_result = None
-            
             # If the input is a PDF, process all pages
             if image_path.lower().endswith('.pdf'):
                 image_pages = self._pdf_to_images(image_path)
                 responses = []
                 total_pages = len(image_pages)
                 
+                # Every page of the document uses the same prompt
+                prompt = self._build_prompt(format_type, custom_prompt, language)
+                
                 for idx, page_file in enumerate(image_pages):
                     # Report progress for PDF pages
-                    if self.progress_callback:
+                    if report_progress and self.progress_callback:
                         self.progress_callback(idx, total_pages, f"Processando página {idx + 1} de {total_pages}")
                     
                     # Process each page with preprocessing if enabled
                     if preprocess:
-                        preprocessed_path = self._preprocess_image(page_file, language)
+                        image_base64 = self._preprocess_image(page_file, language)
                     else:
-                        preprocessed_path = page_file
-
-                    image_base64 = self._encode_image(preprocessed_path)
-
-                    if custom_prompt and custom_prompt.strip():
-                        prompt = custom_prompt
-                    else:
-                        prompts = {
-                            "markdown": f"""Extract all text content from this image in {language} **exactly as it appears**, without modification, summarization, or omission.
-                                Format the output in markdown:
-                                - Use headers (#, ##, ###) **only if they appear in the image**
-                                - Preserve original lists (-, *, numbered lists) as they are
-                                - Maintain all text formatting (bold, italics, underlines) exactly as seen
-                                - **Do not add, interpret, or restructure any content**
-                            """,
-                            "text": f"""Extract all visible text from this image in {language} **without any changes**.
-                                - **Do not summarize, paraphrase, or infer missing text.**
-                                - Retain all spacing, punctuation, and formatting exactly as in the image.
-                                - If text is unclear or partially visible, extract as much as possible without guessing.
-                                - **Include all text, even if it seems irrelevant or repeated.** 
-                                """,
-
-
-                           "json": f"""Extract all text from this image in {language} and format it as JSON, **strictly preserving** the structure.
-                                - **Do not summarize, add, or modify any text.**
-                                - Maintain hierarchical sections and subsections as they appear.
-                                - Use keys that reflect the document's actual structure (e.g., "title", "body", "footer").
-                                - Include all text, even if fragmented, blurry, or unclear.
-                                """,
-
-
-                            "structured": f"""Extract all text from this image in {language}, **ensuring complete structural accuracy**:
-                                - Identify and format tables **without altering content**.
-                                - Preserve list structures (bulleted, numbered) **exactly as shown**.
-                                - Maintain all section headings, indents, and alignments.
-                                - **Do not add, infer, or restructure the content in any way.**
-                                """,
-
-
-                           "key_value": f"""Extract all key-value pairs from this image in {language} **exactly as they appear**:
-                                - Identify and extract labels and their corresponding values without modification.
-                                - Maintain the exact wording, punctuation, and order.
-                                - Format each pair as 'key: value' **only if clearly structured that way in the image**.
-                                - **Do not infer missing values or add any extra text.**
-                                """,
-
-                            "table": f"""Extract all tabular data from this image in {language} **exactly as it appears**, without modification, summarization, or omission.
-                                - **Preserve the table structure** (rows, columns, headers) as closely as possible.
-                                - **Do not add missing values or infer content**—if a cell is empty, leave it empty.
-                                - Maintain all numerical, textual, and special character formatting.
-                                - If the table contains merged cells, indicate them clearly without altering their meaning.
-                                - Output the table in a structured format such as Markdown, CSV, or JSON, based on the intended use.
-                                """,
+                        image_base64 = self._encode_image(page_file)
 
-                            "doc97": f"""Extract all visible text from this image in {language} **without any changes**.
-                                - **Do not summarize, paraphrase, or infer missing text.**
-                                - Retain all spacing, punctuation, and formatting exactly as in the image.
-                                - If text is unclear or partially visible, extract as much as possible without guessing.
-                                - **Include all text, even if it seems irrelevant or repeated.**
-                                - Format the output as plain text suitable for a Word 97-2003 document.
-                                """,
-
-                        }
-                        prompt = prompts.get(format_type, prompts["text"])
-
-                    # Make the API call
-                    res = self._call_vision_api(image_base64, prompt, preprocessed_path)
+                    # Make the API call (preprocessing keeps the page size, so token estimates use the page file)
+                    res = self._call_vision_api(image_base64, prompt, page_file)
                     # Store raw result for this page
-                    if self.last_raw_result:
-                        self.last_raw_result += f"\n\n--- Page {idx + 1} ---\n{res}"
+                    if raw_result:
+                        raw_result += f"\n\n--- Page {idx + 1} ---\n{res}"
                     else:
-                        self.last_raw_result = f"--- Page {idx + 1} ---\n{res}"
+                        raw_result = f"--- Page {idx + 1} ---\n{res}"
                     # Prefix result with page number
                     responses.append(f"Page {idx + 1}:\n{res}")
 
                     # Clean up temporary files
-                    if preprocess and preprocessed_path.endswith('_preprocessed.jpg'):
-                        os.remove(preprocessed_path)
                     if page_file.endswith('.png'):
                         os.remove(page_file)
 
@@ -554,101 +638,38 @@ class OCRProcessor:
                 if format_type == "json":
                     try:
                         json_data = json.loads(final_result)
-                        return json.dumps(json_data, indent=2)
+                        return json.dumps(json_data, indent=2), raw_result
                     except json.JSONDecodeError:
-                        return final_result
-                return final_result
+                        return final_result, raw_result
+                return final_result, raw_result
 
             # Process non-PDF images as before.
-            processed_path = image_path
             if preprocess:
-                processed_path = self._preprocess_image(image_path, language)
-
-            image_base64 = self._encode_image(processed_path)
-
-            if custom_prompt and custom_prompt.strip():
-                prompt = custom_prompt
+                image_base64 = self._preprocess_image(image_path, language)
             else:
-                prompts = {
-                            "markdown": f"""Extract all text content from this image in {language} **exactly as it appears**, without modification, summarization, or omission.
-                                Format the output in markdown:
-                                - Use headers (#, ##, ###) **only if they appear in the image**
-                                - Preserve original lists (-, *, numbered lists) as they are
-                                - Maintain all text formatting (bold, italics, underlines) exactly as seen
-                                - **Do not add, interpret, or restructure any content**
-                            """,
-                            "text": f"""Extract all visible text from this image in {language} **without any changes**.
-                                - **Do not summarize, paraphrase, or infer missing text.**
-                                - Retain all spacing, punctuation, and formatting exactly as in the image.
-                                - If text is unclear or partially visible, extract as much as possible without guessing.
-                                - **Include all text, even if it seems irrelevant or repeated.** 
-                                """,
-
-
-                           "json": f"""Extract all text from this image in {language} and format it as JSON, **strictly preserving** the structure.
-                                - **Do not summarize, add, or modify any text.**
-                                - Maintain hierarchical sections and subsections as they appear.
-                                - Use keys that reflect the document's actual structure (e.g., "title", "body", "footer").
-                                - Include all text, even if fragmented, blurry, or unclear.
-                                """,
-
-
-                            "structured": f"""Extract all text from this image in {language}, **ensuring complete structural accuracy**:
-                                - Identify and format tables **without altering content**.
-                                - Preserve list structures (bulleted, numbered) **exactly as shown**.
-                                - Maintain all section headings, indents, and alignments.
-                                - **Do not add, infer, or restructure the content in any way.**
-                                """,
-
-
-                           "key_value": f"""Extract all key-value pairs from this image in {language} **exactly as they appear**:
-                                - Identify and extract labels and their corresponding values without modification.
-                                - Maintain the exact wording, punctuation, and order.
-                                - Format each pair as 'key: value' **only if clearly structured that way in the image**.
-                                - **Do not infer missing values or add any extra text.**
-                                """,
+                image_base64 = self._encode_image(image_path)
 
-                            "table": f"""Extract all tabular data from this image in {language} **exactly as it appears**, without modification, summarization, or omission.
-                                - **Preserve the table structure** (rows, columns, headers) as closely as possible.
-                                - **Do not add missing values or infer content**—if a cell is empty, leave it empty.
-                                - Maintain all numerical, textual, and special character formatting.
-                                - If the table contains merged cells, indicate them clearly without altering their meaning.
-                                - Output the table in a structured format such as Markdown, CSV, or JSON, based on the intended use.
-                                """,
+            prompt = self._build_prompt(format_type, custom_prompt, language)
 
-                            "doc97": f"""Extract all visible text from this image in {language} **without any changes**.
-                                - **Do not summarize, paraphrase, or infer missing text.**
-                                - Retain all spacing, punctuation, and formatting exactly as in the image.
-                                - If text is unclear or partially visible, extract as much as possible without guessing.
-                                - **Include all text, even if it seems irrelevant or repeated.**
-                                - Format the output as plain text suitable for a Word 97-2003 document.
-                                """,
-                }
-                prompt = prompts.get(format_type, prompts["text"])
-
-            result = self._call_vision_api(image_base64, prompt, processed_path)
+            result = self._call_vision_api(image_base64, prompt, image_path)
             
             # Store raw result before any formatting
-            self.last_raw_result = result
-            
-            # Clean up temporary files
-            if processed_path.endswith(('_preprocessed.jpg', '_temp.jpg')):
-                os.remove(processed_path)
+            raw_result = result
 
             if format_type == "json":
                 try:
                     json_data = json.loads(result)
-                    return json.dumps(json_data, indent=2)
+                    return json.dumps(json_data, indent=2), raw_result
                 except json.JSONDecodeError:
-                    return result
+                    return result, raw_result
 
-            return result
+            return result, raw_result
         except Exception as e:
             import traceback
             error_details = traceback.format_exc()
             error_msg = f"Error processing image {image_path}: {str(e)}\n\nDetails:\n{error_details}"
             print(error_msg)  # Log to console for debugging
-            return f"Error processing image: {str(e)}"
+            return f"Error processing image: {str(e)}", raw_result
 
     def process_batch(
         self,
@@ -666,7 +687,7 @@ class OCRProcessor:
             input_path: Path to directory or list of image paths
             format_type: Output format type
             recursive: Whether to search directories recursively
-            preprocess: Whether to apply image preprocessing
+            preprocess: Whether to apply image preprocessing; "auto" decides per image
             custom_prompt: If provided, this prompt overrides the default for each image
             language: Language code to apply language specific OCR preprocessing
             
@@ -691,43 +712,52 @@ class OCRProcessor:
         completed = 0
         total = len(image_paths)
 
-        # Process images sequentially (one at a time) to avoid concurrency issues
-        with tqdm(total=total, desc="Processing images", disable=self.progress_callback is not None) as pbar:
-            for path in image_paths:
-                path_str = str(path)
+        # Process up to max_workers images concurrently; each worker returns its own
+        # raw result, so no per-file state is shared between threads
+        with tqdm(total=total, desc="Processing images", disable=self.progress_callback is not None) as pbar, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = {
+                executor.submit(
+                    self._process_image,
+                    str(path), format_type, preprocess, custom_prompt, language,
+                    report_progress=False
+                ): str(path)
+                for path in image_paths
+            }
+            
+            # Consume files as they finish so progress reflects completed work,
+            # then rebuild the outputs in submission order below
+            outcomes = {}
+            for future in concurrent.futures.as_completed(futures):
+                path_str = futures[future]
                 try:
-                    # Update progress before processing
-                    completed += 1
-                    if self.progress_callback:
-                        self.progress_callback(completed, total, f"Processando arquivo {completed} de {total}: {os.path.basename(path_str)}")
-                    
-                    # Process one file at a time
-                    result = self.process_image(
-                        image_path=path_str,
-                        format_type=format_type,
-                        preprocess=preprocess,
-                        custom_prompt=custom_prompt,
-                        language=language
-                    )
-                    
-                    # Store raw result for this file
-                    if self.last_raw_result:
-                        self.raw_results[path_str] = self.last_raw_result
-                        self.last_raw_result = None  # Reset for next file
-                    
-                    # Check if result is an error message
-                    if result.startswith("Error processing image:"):
-                        errors[path_str] = result
-                    else:
-                        results[path_str] = result
-                        
+                    outcomes[path_str] = future.result()
                 except Exception as e:
                     error_msg = f"Error processing image: {str(e)}"
-                    errors[path_str] = error_msg
+                    outcomes[path_str] = (error_msg, None)
                     print(f"Erro ao processar {path_str}: {error_msg}")  # Log error
                 
+                # Report progress from the calling thread once the file is done
+                completed += 1
+                if self.progress_callback:
+                    self.progress_callback(completed, total, f"Processado arquivo {completed} de {total}: {os.path.basename(path_str)}")
+                
                 pbar.update(1)
 
+        for path in image_paths:
+            path_str = str(path)
+            result, raw_result = outcomes[path_str]
+            
+            # Store raw result for this file
+            if raw_result:
+                self.raw_results[path_str] = raw_result
+            
+            # Check if result is an error message
+            if result.startswith("Error processing image:"):
+                errors[path_str] = result
+            else:
+                results[path_str] = result
+
         return {
             "results": results,
             "errors": errors,